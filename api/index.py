@@ -7,7 +7,6 @@ import logging
 import traceback
 from flask import Flask, request, jsonify
 import telebot
-from user_storage import initialize_user_storage
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +15,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Project modules log while importing, so import them once logging is configured
+from user_storage import initialize_user_storage
+
 # Initialize Flask app
 app = Flask(__name__)
 
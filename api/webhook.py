@@ -7,7 +7,6 @@ import os
 import logging
 import telebot
 from flask import Blueprint, request, jsonify
-from user_storage import initialize_user_storage
 import traceback
 
 # Configure logging
@@ -17,6 +16,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Project modules log while importing, so import them once logging is configured
+from user_storage import initialize_user_storage
+
 # Initialize Flask Blueprint
 app = Blueprint('webhook', __name__)
 
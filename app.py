@@ -7,8 +7,6 @@ import logging
 import threading
 from flask import Flask, request, jsonify, render_template
 import telebot
-from bot import create_bot
-from user_storage import initialize_user_storage
 from dotenv import load_dotenv
 
 # Configure logging
@@ -18,6 +16,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Project modules log while importing, so import them once logging is configured
+from bot import create_bot
+from user_storage import initialize_user_storage
+
 # Load environment variables
 load_dotenv()
 
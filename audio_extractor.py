@@ -8,10 +8,6 @@ import tempfile
 import subprocess
 from pathlib import Path
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # Create a directory for extracted audio if it doesn't exist
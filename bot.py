@@ -5,13 +5,15 @@ Using pyTelegramBotAPI (telebot) library.
 import os
 import logging
 import json
+import time
+import hashlib
 import threading
 import asyncio
 import telebot
 from telebot import types
-from media_downloader import download_video
+from media_downloader import download_video, download_tiktok_slideshow
 from audio_extractor import extract_audio
-from pinterest_extractor import download_pinterest_image, download_pinterest_video
+from pinterest_extractor import download_pinterest_media
 from user_storage import (
     save_media,
     retrieve_media,
@@ -21,10 +23,6 @@ from user_storage import (
 )
 from utils import is_valid_url, get_media_type, get_url_type, sanitize_filename
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # Store temporary user data
@@ -190,19 +188,12 @@ def create_bot(token):
                 asyncio.set_event_loop(loop)
                 
                 if platform == 'pinterest':
-                    if media_type == 'image':
-                        # Download Pinterest image
-                        download_result = loop.run_until_complete(download_pinterest_image(url))
-                        if download_result:
-                            logger.info(f"Downloaded Pinterest image to {download_result}")
-                    else:
-                        # Download Pinterest video
-                        download_result = loop.run_until_complete(download_pinterest_video(url))
-                        if download_result:
-                            logger.info(f"Downloaded Pinterest video to {download_result}")
+                    # The pin page decides between video and image; it is fetched only once
+                    download_result = loop.run_until_complete(download_pinterest_media(url))
+                    if download_result:
+                        logger.info(f"Downloaded Pinterest media to {download_result}")
                 elif platform == 'tiktok' and media_type == 'slideshow':
                     # For TikTok slideshows, use the dedicated slideshow download function
-                    from media_downloader import download_tiktok_slideshow
                     logger.info("Using dedicated TikTok slideshow downloader")
                     slideshow_result = loop.run_until_complete(download_tiktok_slideshow(url))
                     if slideshow_result:
@@ -306,8 +297,6 @@ def create_bot(token):
                                 continue
                                 
                             # Create a unique ID for this image
-                            import hashlib
-                            import time
                             img_id = hashlib.md5(f"{user_id}_{time.time()}_{img_path}_{i}".encode()).hexdigest()[:10]
                             
                             # Cache the image path
@@ -420,8 +409,6 @@ def create_bot(token):
                     return
                 
                 # Generate a unique ID for this media file
-                import hashlib
-                import time
                 media_id = hashlib.md5(f"{user_id}_{time.time()}_{media_path}".encode()).hexdigest()[:10]
                 
                 # Store the media path in the cache
@@ -429,10 +416,13 @@ def create_bot(token):
                     media_cache[user_id] = {}
                 media_cache[user_id][media_id] = media_path
                 
+                # The downloaded file decides the type; a Pinterest link may turn out to be a video
+                local_media_type = get_media_type(media_path)
+                
                 # Create inline keyboard markup
                 markup = types.InlineKeyboardMarkup()
                 
-                if media_type == 'video' or media_type == 'slideshow':
+                if local_media_type == 'video' or media_type == 'slideshow':
                     # For videos and slideshows, add audio extraction button
                     extract_button = types.InlineKeyboardButton("🎵 Download Audio", 
                                                             callback_data=f"extract_{media_id}")
@@ -449,8 +439,6 @@ def create_bot(token):
                 bot.delete_message(message.chat.id, status_message.message_id)
                 
                 # Send the media with appropriate method based on type
-                local_media_type = get_media_type(media_path)
-                
                 if local_media_type == 'video':
                     # Send as video
                     with open(media_path, 'rb') as media_file:
@@ -527,8 +515,6 @@ def create_bot(token):
                     return
                 
                 # Generate a unique ID for the audio
-                import hashlib
-                import time
                 audio_id = hashlib.md5(f"{user_id}_{time.time()}_{audio_path}".encode()).hexdigest()[:10]
                 
                 # Add audio to media cache
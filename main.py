@@ -6,9 +6,8 @@ when run directly, or serves as a Flask web application when imported.
 import os
 import logging
 import threading
+import traceback
 from dotenv import load_dotenv
-from bot import create_bot, start_bot
-from user_storage import initialize_user_storage
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +16,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Project modules log while importing, so import them once logging is configured
+from bot import create_bot, start_bot
+from user_storage import initialize_user_storage
+
 # Global variable to track if we're running the bot or the web app
 is_bot_running = False
 
@@ -80,7 +83,6 @@ def run_bot():
         logger.error(f"Error running bot: {e}")
         with open('/tmp/bot_debug.log', 'a') as f:
             f.write(f"Error running bot: {str(e)}\n")
-            import traceback
             f.write(traceback.format_exc())
     finally:
         is_bot_running = False
@@ -10,37 +10,246 @@ import urllib.parse
 import tempfile
 import yt_dlp
 import re
-import requests
 import json
+import html
 import time
 import shutil
-from bs4 import BeautifulSoup
-from utils import sanitize_filename
+import threading
+import concurrent.futures
+import types
+import collections
+import hashlib
+import atexit
+from bs4 import BeautifulSoup, SoupStrainer
+from utils import sanitize_filename, unique_name, HTTP_SESSION, resolve_short_url, load_json_cache, save_json_cache
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Prefer the C-backed lxml parser, falling back to the stdlib parser if it is unavailable
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# selectolax's C parser is used for the slideshow detector's tag scan when installed
+try:
+    from selectolax.lexbor import LexborHTMLParser as FastHTMLParser
+except ImportError:
+    FastHTMLParser = None
+
+# Prefer orjson for parsing embedded page JSON, falling back to the stdlib json module
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Only the tags the slideshow downloader actually reads are kept in its parse tree
+SLIDESHOW_STRAINER = SoupStrainer(['meta', 'script', 'audio'])
+# Likewise for the slideshow detector's BeautifulSoup fallback
+DETECTOR_STRAINER = SoupStrainer(['img', 'meta', 'script'])
+
+# Raw-HTML scanners for image URLs in <img> tags and inline background-image styles
+_IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+_IMG_SRC_RE = re.compile(r'\ssrc\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+_IMG_SRCSET_RE = re.compile(r'\ssrcset\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+_BG_IMAGE_RE = re.compile(r'background-image\s*:[^;"\'>]*url\((?:[\'"]|&quot;)?(.*?)(?:[\'"]|&quot;)?\)')
+
+# Markers of embedded TikTok data in <script> tags worth scanning for JSON
+_SCRIPT_DATA_MARKER_RE = re.compile('|'.join(re.escape(marker) for marker in (
+    'window.__INIT_PROPS__',
+    'window.SIGI_STATE',
+    'window.__NEXT_DATA__',
+    '"images":',
+    '"imageList":',
+    '"imagePostInfo":',
+)))
+
+# Braces and double-quoted strings, used to find balanced JSON objects in script text
+_JSON_TOKEN_RE = re.compile(r'[{}]|"[^"\\]*(?:\\.[^"\\]*)*"')
+
+def _iter_json_objects(text):
+    """
+    Yield each top-level brace-balanced {...} substring of a script.
+
+    Braces inside double-quoted strings are ignored, so the scan is a single
+    linear pass with no regex backtracking over the object bodies.
+
+    Args:
+        text: The script text to scan
+
+    Yields:
+        str: Candidate JSON object text
+    """
+    depth = 0
+    start = 0
+    for match in _JSON_TOKEN_RE.finditer(text):
+        token = match.group(0)
+        if token == '{':
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif token == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:match.end()]
+
+# Download URL patterns for the third-party APIs tried by download_tiktok_direct
+_TIKTOK_API_PATTERNS = {
+    'snaptik': re.compile(r'(https:\/\/[^"\']+\.mp4[^"\']*)(?="|\')(?!.*watermark)'),
+    'tikmate': re.compile(r'(https:\/\/tikmate\.app\/download\/\w+\.mp4)(?="|\')(?!.*watermark)'),
+    'ssstik': re.compile(r'href="(https:\/\/[^"\']+\.mp4[^"\']*)(?="|\')(?!.*watermark)'),
+}
+
+# Video URL patterns for scraping a TikTok page directly
+_TIKTOK_PAGE_VIDEO_PATTERNS = [
+    re.compile(r'(https:\/\/[^"\'\s]+\.mp4[^"\'\s]*)(?=[\s"\'<])'),
+    re.compile(r'playAddr":"(https:\/\/[^"]+\.mp4[^"]*)"'),
+    re.compile(r'playAddr:[ ]*"([^"]+)"'),
+    re.compile(r'"video":[ ]*{"id":"[^"]+","url":"([^"]+)"'),
+]
+
+# JSON-escaped slashes (\u002F and \/) in URLs scraped from page scripts
+_ESCAPED_SLASH_RE = re.compile(r'\\u002F|\\/')
+
+def _find_mp4_urls(text):
+    """
+    Find the unique mp4 URLs in a page, in page order.
+    
+    Equivalent to re.findall(r'(https://[^"\']+\.mp4[^"\']*)', text), but anchored on
+    the literal '.mp4': for each hit the surrounding quote-delimited run is located
+    with str.find/rfind and the URL runs from its first https:// to the closing
+    quote. Quote positions are cached, so the page is walked roughly once.
+    
+    Args:
+        text (str): Page or API response body
+        
+    Returns:
+        list: mp4 URLs, deduplicated
+    """
+    urls = []
+    length = len(text)
+    next_double = next_single = -1
+    run_start = 0
+    run_end = -1
+    pos = 0
+    while True:
+        index = text.find('.mp4', pos)
+        if index < 0:
+            break
+        if index > run_end:
+            # Moved past the previous quote, so find the bounds of the new run
+            run_start = max(text.rfind('"', run_end + 1, index),
+                            text.rfind("'", run_end + 1, index),
+                            run_end) + 1
+            if next_double < index:
+                next_double = text.find('"', index)
+                if next_double < 0:
+                    next_double = length
+            if next_single < index:
+                next_single = text.find("'", index)
+                if next_single < 0:
+                    next_single = length
+            run_end = min(next_double, next_single)
+        # At least one character must sit between https:// and .mp4
+        start = text.find('https://', run_start, max(index - 1, 0))
+        if start >= 0:
+            urls.append(text[start:run_end])
+            pos = run_end + 1
+        else:
+            pos = index + 1
+    return list(dict.fromkeys(urls))
+
+# Special TikTok image patterns - they don't always use clear .jpg extensions in URLs
+_TIKTOK_IMAGE_PATTERNS = [
+    re.compile(r'(https?://[^"\'>\s]+\.image[^"\'>\s]*)'),
+    re.compile(r'(https?://[^"\'>\s]+\.tiktokcdn[^"\'>\s]*)'),
+    re.compile(r'(https://[^"\'>\s]+\.tiktok\.com/[^"\'>\s]+)'),
+    re.compile(r'property="og:image"\s+content="([^"]+)"'),
+    re.compile(r'<img[^>]+src="([^"]+)"'),
+    re.compile(r'"image":"([^"]+)"'),
+    re.compile(r'"images":\s*\[\s*"([^"]+)"'),
+    re.compile(r'"imageList":\s*\[\s*"([^"]+)"'),
+    re.compile(r'"imagePostInfo":[^{]*"url":"([^"]+)"'),
+    re.compile(r'"originCover":"([^"]+)"'),
+    re.compile(r'"thumbnailUrl":"([^"]+)"'),
+    re.compile(r'"imageUrl":"([^"]+)"'),
+    re.compile(r'"animatedCoverUrl":"([^"]+)"'),
+]
+# All of the above as one alternation, so the page is scanned once. Each alternative is
+# wrapped in a named group p<index>; the URL is the group right after it.
+_TIKTOK_IMAGE_RE = re.compile('|'.join(
+    f'(?P<p{index}>{pattern.pattern})' for index, pattern in enumerate(_TIKTOK_IMAGE_PATTERNS)
+))
+_GENERIC_IMAGE_URL_RE = re.compile(r'(https?://[^\s\'"\)]+\.(jpg|jpeg|png|webp))')
+_PHOTO_ITEM_ID_RE = re.compile(r'photo/(\d+)')
+
+# Attribute filter for absolute http(s) URLs in BeautifulSoup lookups
+_HTTP_URL_RE = re.compile(r'^http')
+
+# Audio URL patterns for TikTok slideshow soundtracks
+_AUDIO_URL_PATTERNS = [
+    re.compile(r'(https?://[^\s\'"\)]+\.(mp3|m4a|aac|wav))'),
+    re.compile(r'"musicUrl"\s*:\s*"([^"]+)"'),
+    re.compile(r'"audioUrl"\s*:\s*"([^"]+)"'),
+    re.compile(r'"audio_url"\s*:\s*"([^"]+)"'),
+    re.compile(r'"music":[^}]*"playUrl"\s*:\s*"([^"]+)"'),
+    re.compile(r'"audio":[^}]*"url"\s*:\s*"([^"]+)"'),
+    re.compile(r'"soundtrack":[^}]*"url"\s*:\s*"([^"]+)"'),
+]
+# The same patterns as one alternation, scanned once; group a<index> wraps each
+# alternative and the URL is the group right after it
+_AUDIO_URL_RE = re.compile('|'.join(
+    f'(?P<a{index}>{pattern.pattern})' for index, pattern in enumerate(_AUDIO_URL_PATTERNS)
+))
+
+def _find_audio_url(text):
+    """
+    Find the soundtrack URL in a TikTok page with a single scan.
+    
+    Patterns keep their priority: the first match of the earliest pattern in
+    _AUDIO_URL_PATTERNS wins, and the scan stops as soon as the top pattern matches.
+    
+    Args:
+        text (str): Page HTML
+        
+    Returns:
+        str: Audio URL or None if no pattern matches
+    """
+    best_index, best_url = len(_AUDIO_URL_PATTERNS), None
+    for match in _AUDIO_URL_RE.finditer(text):
+        index = int(match.lastgroup[1:])
+        if index < best_index:
+            best_index, best_url = index, match.group(match.lastindex + 1)
+            if index == 0:
+                break
+    return best_url
+
 # Create a downloads directory if it doesn't exist
 DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), "social_media_downloads")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 # Configure yt-dlp options
+# Set MEDIA_DL_DEBUG=1 to get yt-dlp's verbose console output; it is quiet otherwise
+MEDIA_DL_DEBUG = os.environ.get('MEDIA_DL_DEBUG') == '1'
+
 YDL_OPTIONS = {
     'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
     'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
     'noplaylist': True,
-    'quiet': False,  # Set to False to see more debugging info
-    'no_warnings': False,  # Set to False to see warnings
+    'quiet': not MEDIA_DL_DEBUG,
+    'no_warnings': not MEDIA_DL_DEBUG,
     'ignoreerrors': False,  # Set to False to see errors
     'nocheckcertificate': True,
     'restrictfilenames': True,
-    'logtostderr': True,  # Log to stderr for debugging
-    'verbose': True,  # Enable verbose output for debugging
+    'logtostderr': MEDIA_DL_DEBUG,
+    'verbose': MEDIA_DL_DEBUG,
+    'noprogress': not MEDIA_DL_DEBUG,  # Skip per-chunk progress lines
     'socket_timeout': 30,  # Increase timeout
     'retries': 10,  # Increase number of retries
+    'concurrent_fragment_downloads': int(os.environ.get('YTDLP_CONCURRENT_FRAGS', 4)),  # Fetch HLS/DASH fragments in parallel
+    'http_chunk_size': 10485760,  # 10 MB range requests for progressive downloads
     'cachedir': False,  # Disable cache
     'prefer_insecure': True,  # Try HTTP if HTTPS fails
     'http_headers': {
@@ -48,9 +257,507 @@ YDL_OPTIONS = {
     },
 }
 
+# Hand large downloads to aria2c for multi-connection range requests when it is installed
+if shutil.which('aria2c'):
+    YDL_OPTIONS.update({
+        'external_downloader': {'default': 'aria2c'},
+        'external_downloader_args': {
+            'aria2c': ['-x', '16', '-s', '16', '-k', '1M', '--min-split-size=1M', '--summary-interval=0'],
+        },
+    })
+else:
+    logger.info("aria2c not found, using yt-dlp's native downloader")
+
+def _freeze(value):
+    """Recursively wrap dicts in read-only views so shared option templates cannot be mutated."""
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+def _thaw(value):
+    """Recursively copy frozen (or plain) option mappings and lists into fresh mutable containers."""
+    if isinstance(value, (dict, types.MappingProxyType)):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_thaw(v) for v in value]
+    return value
+
+# yt-dlp options for download_video: the base options with more patient retry settings.
+# This and the templates below are read-only; per-call options are built by merging them.
+DOWNLOAD_YDL_OPTIONS = _freeze({
+    **YDL_OPTIONS,
+    'socket_timeout': 60,  # Increased timeout
+    'retries': 5,          # More retries
+    'fragment_retries': 10, # For segmented downloads
+})
+
+# Per-platform yt-dlp option overrides, built once at import
+PLATFORM_YDL_OPTIONS = _freeze({
+    # Try a more reliable approach for TikTok - use multiple APIs and browser simulation
+    'tiktok': {
+        # Enhanced options for TikTok
+        'extractor_retries': 5,  # Increase retry attempts
+        'socket_timeout': 60,    # Increase timeout for slow connections
+        'extractor_args': {
+            'tiktok': {
+                'embed_api': ['tiktokv', 'ssstik', 'tikwm', 'tikmate'],  # Try multiple API endpoints
+                'api_hostname': 'tikmate.app',  # More reliable service
+                'force_api_response': 'yes',
+                'force_mobile_api': 'yes'  # Try mobile API which might be more reliable
+            }
+        },
+        'referer': 'https://www.tiktok.com/',
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
+            'sec-ch-ua-mobile': '?0',
+            'sec-ch-ua-platform': '"Windows"'
+        }
+    },
+    'instagram': {
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Referer': 'https://www.instagram.com/'
+        }
+    },
+    'pinterest': {
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Referer': 'https://www.pinterest.com/'
+        }
+    },
+})
+
+# Extractor arguments for the TikTok retry with a different API
+TIKTOK_FALLBACK_EXTRACTOR_ARGS = _freeze({
+    'tiktok': {
+        'embed_api': 'musicaldown',
+        'api_hostname': 'musicaldown.com',
+        'force_mobile_api': 'yes'
+    }
+})
+
+# API, page and CDN requests go through the process-wide session to reuse its keep-alive connections
+_SESSION = HTTP_SESSION
+
+# Request headers, built once and shared read-only by every request that uses them
+_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+_BROWSER_HEADERS = _freeze({
+    'User-Agent': _USER_AGENT,
+    'Accept-Language': 'en-US,en;q=0.9',
+})
+_TIKTOK_PAGE_HEADERS = _freeze({
+    **_BROWSER_HEADERS,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Referer': 'https://www.tiktok.com/',
+})
+# Full browser fingerprint for the slideshow page, bypassing intermediate caches
+_TIKTOK_SLIDESHOW_HEADERS = _freeze({
+    **_TIKTOK_PAGE_HEADERS,
+    'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache'
+})
+_TIKTOK_FALLBACK_HEADERS = _freeze({
+    **_BROWSER_HEADERS,
+    'Accept': '*/*',
+    'Referer': 'https://www.tiktok.com/',
+})
+_TIKTOK_API_HEADERS = _freeze({
+    'User-Agent': _USER_AGENT,
+    'Referer': 'https://www.tiktok.com/',
+    'Accept': 'application/json'
+})
+_SSSTIK_HEADERS = _freeze({
+    'User-Agent': _USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Content-Type': 'application/x-www-form-urlencoded',
+    'Origin': 'https://ssstik.io',
+    'Referer': 'https://ssstik.io/en'
+})
+_SAVEFROM_HEADERS = _freeze({
+    'User-Agent': _USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.google.com/'
+})
+
+# Precompiled URL classification helpers
+_TIKTOK_DOMAINS = frozenset({'tiktok.com', 'www.tiktok.com', 'm.tiktok.com', 'vm.tiktok.com', 'vt.tiktok.com'})
+_TIKTOK_SHORT_URL_RE = re.compile(r'^\s*https?://(?:vm|vt)\.tiktok\.com/', re.IGNORECASE)
+_AWEME_SLIDESHOW_RE = re.compile(r'(?:^|&)aweme_type=150(?:&|$)')
+_PIC_CNT_RE = re.compile(r'(?:^|&)pic_cnt=([^&]+)')
+
+# Markers in a TikTok page's HTML that indicate a photo slideshow (case-sensitive),
+# and case-insensitive 'photo'/'image' mentions, matched together in one pass.
+# Indicators come first so a marker such as 'photoMode' is never taken as a mere mention.
+_SLIDESHOW_INDICATORS = (
+    'photo-mode', 'photoMode',
+    'photoCarousel', 'photo-carousel',
+    'multiImage', 'multi-image',
+    'image-poster', 'imagePoster',
+    'slideshow', 'slide-show',
+    'carousel-container', 'imageContainer',
+    'photo_mode', 'photoSwiper',
+    'gallery-wrapper',
+)
+_SLIDESHOW_MARKER_RE = re.compile(
+    '(?P<indicator>' + '|'.join(re.escape(indicator) for indicator in _SLIDESHOW_INDICATORS) + ')'
+    '|(?P<mention>(?i:photo|image))'
+)
+# Mention counts above which a page is a likely slideshow
+_MEDIA_MENTION_LIMITS = {'photo': 5, 'image': 10}
+
+def _scan_slideshow_markers(text):
+    """
+    Scan page HTML once for slideshow indicators and frequent 'photo'/'image' mentions.
+
+    Stops at the first indicator or as soon as either word passes its limit,
+    without lowercasing a copy of the page.
+
+    Args:
+        text: The page HTML to scan
+
+    Returns:
+        str: Description of what marked the page as a slideshow, or None
+    """
+    counts = {'photo': 0, 'image': 0}
+    for match in _SLIDESHOW_MARKER_RE.finditer(text):
+        indicator = match.group('indicator')
+        if indicator:
+            return indicator
+        word = match.group('mention').lower()
+        counts[word] += 1
+        if counts[word] > _MEDIA_MENTION_LIMITS[word]:
+            return f"frequent '{word}' mentions"
+    return None
+
+def _slideshow_detector_tags(response):
+    """
+    Parse a TikTok page into the tags the slideshow detector inspects.
+
+    Uses selectolax when it is installed and BeautifulSoup otherwise. Tags are
+    produced lazily so the detector can stop parsing work as soon as it decides.
+
+    Args:
+        response: The requests response for the TikTok page
+
+    Returns:
+        tuple: (img_tags, script_texts, meta_tags), where img_tags and meta_tags
+            yield attribute dicts and script_texts yields script bodies
+    """
+    if FastHTMLParser is not None:
+        tree = FastHTMLParser(response.text)
+        return (
+            (node.attributes for node in tree.css('img')),
+            (node.text() for node in tree.css('script')),
+            (node.attributes for node in tree.css('meta')),
+        )
+
+    soup = BeautifulSoup(response.content, HTML_PARSER, from_encoding=response.encoding,
+                         parse_only=DETECTOR_STRAINER)
+    return (
+        (img.attrs for img in soup.find_all('img')),
+        (script.string for script in soup.find_all('script')),
+        (meta.attrs for meta in soup.find_all('meta')),
+    )
+
+def _attrs_mention(attrs, words):
+    """
+    Check whether any attribute name or value of a tag contains one of the words.
+    
+    Looks at the attributes directly instead of rendering and lowercasing the tag's markup.
+    
+    Args:
+        attrs (dict): Tag attributes; values may be strings, lists (bs4 classes) or None
+        words (tuple): Lowercase words to look for
+        
+    Returns:
+        bool: True if any word occurs in an attribute name or value
+    """
+    for name, value in attrs.items():
+        if isinstance(value, list):
+            value = ' '.join(value)
+        text = f"{name} {value}".lower() if value else name.lower()
+        if any(word in text for word in words):
+            return True
+    return False
+
+def _is_tiktok_host(host):
+    """Check whether a (lowercase, port-less) hostname belongs to TikTok."""
+    return bool(host) and (host in _TIKTOK_DOMAINS or host.endswith('.tiktok.com'))
+
+# Non-TikTok platforms with dedicated yt-dlp options, matched against the domain in one scan
+_PLATFORM_RE = re.compile(r'instagram|youtube|youtu\.be|pinterest')
+_PLATFORM_ALIASES = {'youtu.be': 'youtube'}
+_PLATFORM_NAMES = {'tiktok': 'TikTok', 'instagram': 'Instagram', 'youtube': 'YouTube', 'pinterest': 'Pinterest'}
+
+def _url_platform(parsed_url):
+    """
+    Classify a parsed URL by the platform it belongs to.
+    
+    Args:
+        parsed_url: Result of urllib.parse.urlparse
+        
+    Returns:
+        str: 'tiktok', 'instagram', 'youtube', 'pinterest' or None if unrecognized
+    """
+    if _is_tiktok_host(parsed_url.hostname):
+        return 'tiktok'
+    match = _PLATFORM_RE.search(parsed_url.netloc.lower())
+    if not match:
+        return None
+    return _PLATFORM_ALIASES.get(match.group(0), match.group(0))
+
+# Shared worker threads for yt-dlp downloads. Every bot download runs its own event
+# loop (and so its own default executor), so this pool is what bounds how many
+# yt-dlp/ffmpeg jobs run at once across the whole process.
+YTDLP_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get('YTDLP_WORKERS', 4)),
+    thread_name_prefix='ytdlp',
+)
+atexit.register(YTDLP_EXECUTOR.shutdown, wait=False)
+
+# Idle YoutubeDL instances keyed by option set (the output template is excluded
+# because it is swapped per download). YoutubeDL is not thread-safe, so each
+# instance is checked out by a single download at a time and returned afterwards.
+_ydl_pool = {}
+_ydl_pool_lock = threading.Lock()
+# Cancel token of the download each checked-out instance is serving, if any
+_ydl_cancel_tokens = {}
+
+def _ydl_options_key(options):
+    """Build a hashable key for a yt-dlp option set, ignoring the output template."""
+    return json.dumps({k: v for k, v in options.items() if k != 'outtmpl'}, sort_keys=True, default=str)
+
+def _check_ydl_cancelled(ydl, status):
+    """yt-dlp progress hook that aborts a download once its cancel token is cancelled."""
+    cancel = _ydl_cancel_tokens.get(ydl)
+    if cancel is not None:
+        cancel.check()
+
+def _acquire_ydl(options, cancel=None):
+    """
+    Get a YoutubeDL instance for the given options, reusing an idle one if possible.
+    
+    Args:
+        options (dict): yt-dlp options, including the output template
+        cancel (_CancelToken): Optional token that aborts the download when cancelled
+        
+    Returns:
+        tuple: (pool key, YoutubeDL instance) - pass both to _release_ydl when done
+    """
+    # YoutubeDL keeps a reference to its params and mutates them, so it gets a
+    # private, mutable copy of the (partly read-only) option templates
+    params = _thaw(options)
+    key = _ydl_options_key(params)
+    with _ydl_pool_lock:
+        idle = _ydl_pool.get(key)
+        ydl = idle.pop() if idle else None
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(params)
+        ydl.add_progress_hook(lambda status, ydl=ydl: _check_ydl_cancelled(ydl, status))
+    ydl.params['outtmpl']['default'] = options['outtmpl']
+    if cancel is not None:
+        _ydl_cancel_tokens[ydl] = cancel
+    return key, ydl
+
+def _release_ydl(key, ydl):
+    """Return a YoutubeDL instance to the idle pool."""
+    _ydl_cancel_tokens.pop(ydl, None)
+    with _ydl_pool_lock:
+        _ydl_pool.setdefault(key, []).append(ydl)
+
+@atexit.register
+def _close_ydl_pool():
+    """Close pooled YoutubeDL instances on shutdown."""
+    with _ydl_pool_lock:
+        instances = [ydl for idle in _ydl_pool.values() for ydl in idle]
+        _ydl_pool.clear()
+    for ydl in instances:
+        try:
+            ydl.close()
+        except Exception:
+            pass
+
+def _remove_file(path):
+    """Delete a file if it exists, logging rather than raising on failure."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove %s: %s", path, e)
+
+class _DownloadCancelled(yt_dlp.utils.DownloadCancelled):
+    """Raised inside a download whose result is no longer wanted."""
+
+class _CancelToken:
+    """
+    Cancellation flag shared by one download attempt and the worker threads doing its work.
+    
+    Cancelling the asyncio task of an attempt does not stop its worker thread, so
+    workers call check() between chunks and hand each finished file over with claim().
+    Once cancel() has run, files claimed earlier are deleted and a file claimed later
+    is deleted straight away, so a losing or timed-out attempt leaves nothing behind.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._paths = []
+    
+    def check(self):
+        """Raise _DownloadCancelled if the attempt has been cancelled."""
+        if self._cancelled:
+            raise _DownloadCancelled("download no longer needed")
+    
+    def claim(self, path):
+        """
+        Record a finished file, or delete it if the attempt was cancelled meanwhile.
+        
+        Returns:
+            str: path
+            
+        Raises:
+            _DownloadCancelled: If the attempt was cancelled; the file is gone
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._paths.append(path)
+                return path
+        _remove_file(path)
+        raise _DownloadCancelled("download no longer needed")
+    
+    def cancel(self, keep=None):
+        """Stop the attempt's workers and delete the files it produced, except keep."""
+        with self._lock:
+            self._cancelled = True
+            paths, self._paths = self._paths, []
+        for path in paths:
+            if path != keep:
+                _remove_file(path)
+
+# Copy buffer size for streamed media downloads
+STREAM_CHUNK_SIZE = 1 << 20
+
+def _stream_to_file(url, output_path, headers, timeout=60, cancel=None):
+    """
+    Stream a URL's body to a file. Blocking; run it with asyncio.to_thread.
+    
+    The body is written to a .part file that is renamed into place once complete,
+    so an interrupted transfer never leaves a truncated file at output_path.
+    
+    Args:
+        url (str): URL to download
+        output_path (str): Path to write the body to
+        headers (dict): Request headers
+        timeout (int): Request timeout in seconds
+        cancel (_CancelToken): Optional token checked between chunks; the finished
+            file is claimed by it
+        
+    Raises:
+        requests.HTTPError: If the server answers with an error status
+        _DownloadCancelled: If cancel was cancelled before the file was claimed
+    """
+    part_path = f"{output_path}.part"
+    try:
+        if cancel is not None:
+            cancel.check()
+        with _SESSION.get(url, stream=True, headers=headers, timeout=timeout) as dl_response:
+            dl_response.raise_for_status()
+            with open(part_path, 'wb') as f:
+                dl_response.raw.decode_content = True
+                read = dl_response.raw.read
+                for chunk in iter(lambda: read(STREAM_CHUNK_SIZE), b''):
+                    if cancel is not None:
+                        cancel.check()
+                    f.write(chunk)
+        os.replace(part_path, output_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    if cancel is not None:
+        cancel.claim(output_path)
+
+async def _normalize_tiktok_url(url):
+    """
+    Resolve a vm.tiktok.com / vt.tiktok.com short link; other URLs are returned unchanged.
+    
+    Args:
+        url (str): TikTok URL
+        
+    Returns:
+        str: Full TikTok URL
+    """
+    if _TIKTOK_SHORT_URL_RE.match(url):
+        return await asyncio.to_thread(resolve_short_url, url)
+    return url
+
+# Recently fetched TikTok pages and slideshow verdicts, keyed by canonical URL.
+# The bot checks for a slideshow and then downloads it, so both steps share one page fetch.
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_SIZE = 32
+_page_cache = collections.OrderedDict()
+_slideshow_verdicts = collections.OrderedDict()
+_page_cache_lock = threading.Lock()
+
+def _cache_get(cache, key):
+    """Return a live entry from one of the page caches, or None. Caller holds _page_cache_lock."""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return entry[1]
+
+def _cache_put(cache, key, value):
+    """Store an entry in one of the page caches, evicting the oldest. Caller holds _page_cache_lock."""
+    cache[key] = (time.time() + PAGE_CACHE_TTL, value)
+    cache.move_to_end(key)
+    while len(cache) > PAGE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+async def _fetch_tiktok_page(url, headers):
+    """
+    Fetch a TikTok page, reusing a recent successful response for the same URL.
+    
+    Args:
+        url (str): Resolved TikTok page URL
+        headers (dict): Request headers for a fresh fetch
+        
+    Returns:
+        requests.Response: The page response
+    """
+    key = _canonical_url(url)
+    with _page_cache_lock:
+        cached = _cache_get(_page_cache, key)
+    if cached is not None:
+        logger.info("Using cached TikTok page for %s", url)
+        return cached
+    
+    response = await asyncio.to_thread(_SESSION.get, url, headers=headers)
+    if response.status_code == 200:
+        with _page_cache_lock:
+            _cache_put(_page_cache, key, response)
+    return response
+
 async def is_tiktok_slideshow(url):
     """
     Check if the TikTok URL is a slideshow (photo post) rather than a video.
+    Recent verdicts are cached per URL.
     
     Args:
         url (str): TikTok URL to check
@@ -58,31 +765,29 @@ async def is_tiktok_slideshow(url):
     Returns:
         bool: True if it's a slideshow, False otherwise
     """
-    # First, normalize the URL if it's shortened
-    try:
-        if ('vm.tiktok.com' in url.lower() or 
-            'vt.tiktok.com' in url.lower() or 
-            'www.tiktok.com' not in url.lower()):
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-            }
-            response = requests.head(url, headers=headers, allow_redirects=True)
-            if response.status_code == 200:
-                url = response.url
-                logger.info(f"Resolved URL to: {url}")
-    except Exception as e:
-        logger.warning(f"Error following TikTok redirect: {e}")
+    key = _canonical_url(url)
+    with _page_cache_lock:
+        verdict = _cache_get(_slideshow_verdicts, key)
+    if verdict is not None:
+        return verdict
     
-    # Parse the URL
-    parsed_url = urllib.parse.urlparse(url)
-    if 'tiktok' not in parsed_url.netloc.lower():
-        return False
+    verdict = await _detect_tiktok_slideshow(url)
+    with _page_cache_lock:
+        _cache_put(_slideshow_verdicts, key, verdict)
+    return verdict
+
+def _has_slideshow_url_markers(parsed_url):
+    """
+    Check a parsed TikTok URL's path and query for slideshow markers.
+    
+    Args:
+        parsed_url: Result of urllib.parse.urlparse for a TikTok URL
         
-    # Check if the URL contains photo indicators
+    Returns:
+        bool: True if the URL itself identifies a slideshow
+    """
     path = parsed_url.path.lower()
-    query = urllib.parse.parse_qs(parsed_url.query)
+    query = parsed_url.query
     
     # Method 1: Check for photo URL pattern (contains /photo/ in path)
     if '/photo/' in path:
@@ -91,91 +796,126 @@ async def is_tiktok_slideshow(url):
     
     # Method 2: Check URL parameters that indicate a slideshow    
     # Check for aweme_type=150 parameter (TikTok photo posts)
-    if 'aweme_type' in query and query['aweme_type'][0] == '150':
+    if _AWEME_SLIDESHOW_RE.search(query):
         logger.info("Detected TikTok slideshow by aweme_type=150")
         return True
         
     # Check for pic_cnt parameter which indicates multiple photos
-    if 'pic_cnt' in query:
+    pic_cnt_match = _PIC_CNT_RE.search(query)
+    if pic_cnt_match:
         try:
-            if query['pic_cnt'][0] != '0':
-                pic_count = int(query['pic_cnt'][0])
+            if pic_cnt_match.group(1) != '0':
+                pic_count = int(pic_cnt_match.group(1))
                 if pic_count > 0:
-                    logger.info(f"Detected TikTok slideshow by pic_cnt={pic_count}")
+                    logger.info("Detected TikTok slideshow by pic_cnt=%s", pic_count)
                     return True
         except (ValueError, TypeError, IndexError):
             # If pic_cnt is present but not a valid number, it might still be a slideshow
             logger.info("Detected possible TikTok slideshow by non-numeric pic_cnt")
             return True
     
+    return False
+
+async def _detect_tiktok_slideshow(url):
+    """
+    Check if the TikTok URL is a slideshow (photo post) rather than a video.
+    
+    Args:
+        url (str): TikTok URL to check
+        
+    Returns:
+        bool: True if it's a slideshow, False otherwise
+    """
+    # Check the URL as given first, so an obvious photo link needs no network round trip
+    parsed_url = urllib.parse.urlparse(url)
+    if _is_tiktok_host(parsed_url.hostname) and _has_slideshow_url_markers(parsed_url):
+        return True
+    
+    # Otherwise normalize the URL if it's shortened (or on any host other than www.tiktok.com)
+    if parsed_url.hostname != 'www.tiktok.com':
+        url = await asyncio.to_thread(resolve_short_url, url)
+        parsed_url = urllib.parse.urlparse(url)
+        if not _is_tiktok_host(parsed_url.hostname):
+            return False
+        if _has_slideshow_url_markers(parsed_url):
+            return True
+    
     # Method 3: Check the content of the page for slideshow indicators
     # For URLs that don't have obvious indicators in URL, need to check page content
     try:
         # Let's try to fetch the page content
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Referer': 'https://www.tiktok.com/',
-        }
-        response = requests.get(url, headers=headers)
+        response = await _fetch_tiktok_page(url, _TIKTOK_PAGE_HEADERS)
         if response.status_code == 200:
-            # Check for various indicators in the HTML that suggest it's a slideshow
-            html_indicators = [
-                'photo-mode', 'photoMode', 
-                'photoCarousel', 'photo-carousel',
-                'multiImage', 'multi-image',
-                'image-poster', 'imagePoster',
-                'slideshow', 'slide-show',
-                'carousel-container', 'imageContainer',
-                'photo_mode', 'photoSwiper',
-                'gallery-wrapper'
-            ]
-            
-            for indicator in html_indicators:
-                if indicator in response.text:
-                    logger.info(f"Detected TikTok slideshow by {indicator} in HTML")
-                    return True
+            # Check for various indicators in the HTML that suggest it's a slideshow,
+            # or 'photo'/'image' being mentioned many times
+            marker = _scan_slideshow_markers(response.text)
+            if marker:
+                logger.info("Detected TikTok slideshow by %s in HTML", marker)
+                return True
             
             # Look for specific HTML structures that indicate a slideshow
-            soup = BeautifulSoup(response.text, 'html.parser')
+            img_tags, script_texts, meta_tags = _slideshow_detector_tags(response)
             
             # Check for img tags that could be part of a slideshow
             slideshow_img_count = 0
-            for img in soup.find_all('img'):
+            for img_attrs in img_tags:
                 # If there are multiple images with similar classes/structure, might be a slideshow
-                if 'data-src' in img.attrs or 'carousel' in str(img).lower() or 'slide' in str(img).lower():
+                if 'data-src' in img_attrs or _attrs_mention(img_attrs, ('carousel', 'slide')):
                     slideshow_img_count += 1
                     if slideshow_img_count >= 2:  # If we find at least 2 slideshow-like images
                         logger.info("Detected TikTok slideshow by multiple carousel-style images in HTML")
                         return True
             
             # Look for JSON data in scripts that might indicate a slideshow
-            for script in soup.find_all('script'):
-                if script.string and any(x in script.string for x in ['imageList', 'imageMode', 'images":', 'photoIds']):
+            for script_text in script_texts:
+                if script_text and any(x in script_text for x in ['imageList', 'imageMode', 'images":', 'photoIds']):
                     logger.info("Detected TikTok slideshow by image-related data in script")
                     return True
                     
-            # Fallback: If the page has 'photo' in its content multiple times, it might be a slideshow
-            if response.text.lower().count('photo') > 5 or response.text.lower().count('image') > 10:
-                logger.info("Detected possible TikTok slideshow by frequency of 'photo' or 'image' mentions in HTML")
-                return True
-                
             # Check for meta tags that might indicate a slideshow
-            meta_tags = soup.find_all('meta')
             image_meta_count = 0
-            for meta in meta_tags:
-                if 'content' in meta.attrs and meta['content'].startswith('http') and 'image' in str(meta).lower():
+            for meta_attrs in meta_tags:
+                if (meta_attrs.get('content') or '').startswith('http') and _attrs_mention(meta_attrs, ('image',)):
                     image_meta_count += 1
                     if image_meta_count >= 2:  # If we find at least 2 image-related meta tags
                         logger.info("Detected TikTok slideshow by multiple image meta tags")
                         return True
     except Exception as e:
-        logger.warning(f"Error checking TikTok page content: {e}")
+        logger.warning("Error checking TikTok page content: %s", e)
     
     # If we reach this point, it's probably a regular video
     return False
     
+async def _probe_tiktok_api(api):
+    """
+    Ask one third-party TikTok API for a direct video URL.
+    
+    Args:
+        api (dict): API description from download_tiktok_direct
+        
+    Returns:
+        tuple: (API name, download URL, request headers), or None if the API has no URL
+    """
+    try:
+        logger.info("Trying %s API for TikTok direct download...", api['name'])
+        headers = api.get('headers', _BROWSER_HEADERS)
+        
+        if api['method'] == 'POST':
+            response = await asyncio.to_thread(_SESSION.post, api['url'], data=api['data'], headers=headers, timeout=30)
+        else:
+            response = await asyncio.to_thread(_SESSION.get, api['url'], params=api['data'], headers=headers, timeout=30)
+        
+        if response.status_code == 200:
+            # Search for download URL in response; every API pattern needs a literal '.mp4'
+            match = api['pattern'].search(response.text) if '.mp4' in response.text else None
+            if match:
+                download_url = match.group(1)
+                logger.info("Found direct download URL via %s API: %s", api['name'], download_url)
+                return api['name'], download_url, headers
+    except Exception as e:
+        logger.warning("Error using %s API: %s", api['name'], e)
+    return None
+
 async def download_tiktok_direct(url):
     """
     Direct method to download TikTok videos without using yt-dlp.
@@ -187,21 +927,11 @@ async def download_tiktok_direct(url):
     Returns:
         str: Path to the downloaded video file or None if download fails
     """
-    logger.info(f"Attempting direct TikTok download for: {url}")
+    logger.info("Attempting direct TikTok download for: %s", url)
     
     try:
         # Normalize the URL if it's shortened
-        try:
-            if 'vm.tiktok.com' in url.lower() or 'vt.tiktok.com' in url.lower():
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                }
-                response = requests.head(url, headers=headers, allow_redirects=True)
-                if response.status_code == 200:
-                    url = response.url
-                    logger.info(f"Resolved shortened URL to: {url}")
-        except Exception as e:
-            logger.warning(f"Error following TikTok redirect: {e}")
+        url = await _normalize_tiktok_url(url)
         
         # Multiple APIs for TikTok video download
         apis = [
@@ -210,123 +940,297 @@ async def download_tiktok_direct(url):
                 'url': 'https://snaptik.app/api/ajaxSearch',
                 'method': 'POST',
                 'data': {'url': url},
-                'pattern': r'(https:\/\/[^"\']+\.mp4[^"\']*)(?="|\')(?!.*watermark)'
+                'pattern': _TIKTOK_API_PATTERNS['snaptik']
             },
             {
                 'name': 'tikmate',
                 'url': 'https://tikmate.app/api/lookup',
                 'method': 'POST',
                 'data': {'url': url},
-                'pattern': r'(https:\/\/tikmate\.app\/download\/\w+\.mp4)(?="|\')(?!.*watermark)'
+                'pattern': _TIKTOK_API_PATTERNS['tikmate']
             },
             {
                 'name': 'ssstik',
                 'url': 'https://ssstik.io/abc?url=dl',
                 'method': 'POST',
                 'data': {'id': url, 'locale': 'en', 'tt': 'azbjzm'},
-                'headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'Origin': 'https://ssstik.io',
-                    'Referer': 'https://ssstik.io/en'
-                },
-                'pattern': r'href="(https:\/\/[^"\']+\.mp4[^"\']*)(?="|\')(?!.*watermark)'
+                'headers': _SSSTIK_HEADERS,
+                'pattern': _TIKTOK_API_PATTERNS['ssstik']
             }
         ]
         
-        for api in apis:
-            try:
-                logger.info(f"Trying {api['name']} API for TikTok direct download...")
-                headers = api.get('headers', {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                })
-                
-                if api['method'] == 'POST':
-                    response = requests.post(api['url'], data=api['data'], headers=headers, timeout=30)
-                else:
-                    response = requests.get(api['url'], params=api['data'], headers=headers, timeout=30)
-                
-                if response.status_code == 200:
-                    # Search for download URL in response
-                    import re
-                    matches = re.findall(api['pattern'], response.text)
-                    if matches:
-                        download_url = matches[0]
-                        logger.info(f"Found direct download URL via {api['name']} API: {download_url}")
-                        
-                        # Download the video
-                        import time
-                        timestamp = int(time.time())
-                        output_path = os.path.join(DOWNLOAD_DIR, f"tiktok_direct_{timestamp}.mp4")
-                        
-                        # Use a streaming download to handle large files
-                        with requests.get(download_url, stream=True, headers=headers, timeout=60) as dl_response:
-                            dl_response.raise_for_status()
-                            with open(output_path, 'wb') as f:
-                                for chunk in dl_response.iter_content(chunk_size=8192):
-                                    f.write(chunk)
-                        
-                        logger.info(f"Successfully downloaded TikTok video directly to {output_path}")
-                        return output_path
-            except Exception as e:
-                logger.warning(f"Error using {api['name']} API: {e}")
-                continue
+        # Query every API at once and download from whichever answers first with a
+        # video URL; a failed download moves on to the next API that answers
+        probes = [asyncio.ensure_future(_probe_tiktok_api(api)) for api in apis]
+        try:
+            for next_probe in asyncio.as_completed(probes):
+                found = await next_probe
+                if not found:
+                    continue
+                name, download_url, headers = found
+                try:
+                    output_path = os.path.join(DOWNLOAD_DIR, f"{unique_name('tiktok_direct')}.mp4")
+                    
+                    # Use a streaming download to handle large files
+                    await asyncio.to_thread(_stream_to_file, download_url, output_path, headers)
+                    
+                    logger.info("Successfully downloaded TikTok video directly to %s", output_path)
+                    return output_path
+                except Exception as e:
+                    logger.warning("Error downloading video found via %s API: %s", name, e)
+        finally:
+            for probe in probes:
+                probe.cancel()
         
         # If all APIs fail, try downloading directly from the TikTok page
         try:
             logger.info("Trying direct extraction from TikTok page...")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9',
-            }
-            response = requests.get(url, headers=headers, timeout=30)
+            headers = _BROWSER_HEADERS
+            response = await asyncio.to_thread(_SESSION.get, url, headers=headers, timeout=30)
             
             if response.status_code == 200:
                 # Look for video URLs in the page
-                video_patterns = [
-                    r'(https:\/\/[^"\'\s]+\.mp4[^"\'\s]*)(?=[\s"\'<])',
-                    r'playAddr":"(https:\/\/[^"]+\.mp4[^"]*)"',
-                    r'playAddr:[ ]*"([^"]+)"',
-                    r'"video":[ ]*{"id":"[^"]+","url":"([^"]+)"',
-                ]
-                
-                for pattern in video_patterns:
-                    matches = re.findall(pattern, response.text)
+                for pattern in _TIKTOK_PAGE_VIDEO_PATTERNS:
+                    # Deduplicate while keeping page order so a failing URL is only tried once
+                    matches = dict.fromkeys(pattern.findall(response.text))
                     if matches:
                         for match in matches:
                             try:
-                                download_url = match.replace('\\u002F', '/').replace('\\/', '/')
-                                logger.info(f"Found direct video URL in TikTok page: {download_url}")
+                                download_url = _ESCAPED_SLASH_RE.sub('/', match)
+                                logger.info("Found direct video URL in TikTok page: %s", download_url)
                                 
                                 # Download the video
-                                import time
-                                timestamp = int(time.time())
-                                output_path = os.path.join(DOWNLOAD_DIR, f"tiktok_page_{timestamp}.mp4")
+                                output_path = os.path.join(DOWNLOAD_DIR, f"{unique_name('tiktok_page')}.mp4")
                                 
                                 # Use a streaming download to handle large files
-                                with requests.get(download_url, stream=True, headers=headers, timeout=60) as dl_response:
-                                    if dl_response.status_code == 200:
-                                        with open(output_path, 'wb') as f:
-                                            for chunk in dl_response.iter_content(chunk_size=8192):
-                                                f.write(chunk)
-                                        
-                                        if os.path.getsize(output_path) > 10000:  # Make sure it's not an empty or tiny file
-                                            logger.info(f"Successfully downloaded TikTok video from page to {output_path}")
-                                            return output_path
+                                await asyncio.to_thread(_stream_to_file, download_url, output_path, headers)
+                                
+                                if os.path.getsize(output_path) > 10000:  # Make sure it's not an empty or tiny file
+                                    logger.info("Successfully downloaded TikTok video from page to %s", output_path)
+                                    return output_path
                             except Exception as e:
-                                logger.warning(f"Error downloading from extracted URL: {e}")
+                                logger.warning("Error downloading from extracted URL: %s", e)
                                 continue
         except Exception as e:
-            logger.warning(f"Error during direct page extraction: {e}")
+            logger.warning("Error during direct page extraction: %s", e)
         
         logger.error("All direct TikTok download methods failed")
         return None
         
     except Exception as e:
-        logger.error(f"Error in direct TikTok download: {e}")
+        logger.error("Error in direct TikTok download: %s", e)
+        return None
+
+# Ids of the script tags TikTok embeds its page state JSON in
+_STATE_SCRIPT_IDS = ['__UNIVERSAL_DATA_FOR_REHYDRATION__', 'SIGI_STATE', '__NEXT_DATA__']
+
+# TikTok caps slideshows at 35 photos, so the JSON walk stops once that many URLs are found
+MAX_SLIDESHOW_IMAGES = 35
+
+# Keys that hold image URLs in TikTok's embedded JSON, checked in this order
+_IMAGE_URL_KEYS = ('images', 'imageList', 'imagePostInfo', 'imageUrl', 'displayImage', 'thumbnailUrl')
+
+# Subtrees about the author, soundtrack or counters never hold slideshow images
+_SKIPPED_JSON_KEYS = frozenset({'author', 'authorStats', 'music', 'stats', 'statistics'})
+
+def _extract_image_urls(data, found_urls):
+    """
+    Walk parsed TikTok JSON and collect image URLs.
+    
+    Traverses iteratively in document order, skipping subtrees that cannot
+    hold slideshow images, and stops once MAX_SLIDESHOW_IMAGES URLs are known.
+    
+    Args:
+        data: Parsed JSON value
+        found_urls (dict): Ordered set of URLs to add to
+    """
+    stack = [data]
+    while stack:
+        if len(found_urls) >= MAX_SLIDESHOW_IMAGES:
+            return
+        obj = stack.pop()
+        
+        if isinstance(obj, dict):
+            # Check for common keys that might contain image URLs
+            for key in _IMAGE_URL_KEYS:
+                value = obj.get(key)
+                if isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, str) and item.startswith('http') and 'image' in item.lower():
+                            if item not in found_urls:
+                                found_urls[item] = None
+                                logger.info("Found image URL in JSON data (list): %s", item)
+                elif isinstance(value, str) and value.startswith('http'):
+                    if value not in found_urls:
+                        found_urls[value] = None
+                        logger.info("Found image URL in JSON data (string): %s", value)
+            
+            # Search the remaining dictionary values, first value on top of the stack
+            stack.extend(
+                value for key, value in reversed(obj.items())
+                if key not in _SKIPPED_JSON_KEYS and isinstance(value, (dict, list))
+            )
+        else:
+            stack.extend(item for item in reversed(obj) if isinstance(item, (dict, list)))
+
+def _image_post_urls(data):
+    """
+    Read the photo URLs straight from the imagePostInfo block of TikTok's page state.
+    
+    This is the exact location TikTok keeps a slideshow's photos in
+    (imagePostInfo.images[].imageURL.urlList), so it is tried before the generic
+    walk. Each urlList holds mirrors of one photo, so only the first is taken.
+    
+    Args:
+        data: Parsed page state JSON
+        
+    Returns:
+        list: One URL per photo, or an empty list if there is no imagePostInfo
+    """
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            info = obj.get('imagePostInfo')
+            if isinstance(info, dict):
+                urls = []
+                for image in info.get('images') or ():
+                    image_url = image.get('imageURL') if isinstance(image, dict) else None
+                    url_list = image_url.get('urlList') if isinstance(image_url, dict) else None
+                    if url_list and isinstance(url_list[0], str):
+                        urls.append(url_list[0])
+                if urls:
+                    return urls[:MAX_SLIDESHOW_IMAGES]
+            stack.extend(
+                value for key, value in reversed(obj.items())
+                if key not in _SKIPPED_JSON_KEYS and isinstance(value, (dict, list))
+            )
+        else:
+            stack.extend(item for item in reversed(obj) if isinstance(item, (dict, list)))
+    return []
+
+def _aweme_detail_image_urls(data):
+    """
+    Read the photo URLs from a multi/aweme/detail API response.
+    
+    Stops as soon as MAX_SLIDESHOW_IMAGES unique URLs are collected.
+    
+    Args:
+        data (dict): Parsed API response
+        
+    Returns:
+        list: One URL per photo, in post order
+    """
+    urls = {}
+    for detail in data.get('aweme_details') or ():
+        post_info = detail.get('image_post_info') or {}
+        for image in post_info.get('images') or ():
+            url_list = (image.get('display_image') or {}).get('url_list')
+            if url_list and url_list[0]:
+                urls[url_list[0]] = None
+                if len(urls) >= MAX_SLIDESHOW_IMAGES:
+                    return list(urls)
+    return list(urls)
+
+# Maximum number of slideshow images (plus audio) fetched at the same time
+SLIDESHOW_DOWNLOAD_WORKERS = 8
+
+def _download_slideshow_image(img_url, img_path, headers, i, total, Image):
+    """
+    Download and validate a single slideshow image.
+    
+    Args:
+        img_url (str): URL of the image
+        img_path (str): Path to save the image to
+        headers (dict): Request headers
+        i (int): Index of the image in the slideshow
+        total (int): Number of images in the slideshow
+        Image: The PIL Image module, or None if Pillow is not installed
+        
+    Returns:
+        str: Path to the valid image file or None if it could not be downloaded
+    """
+    try:
+        img_response = _SESSION.get(img_url, headers=headers, stream=True)
+        if img_response.status_code != 200:
+            logger.warning("Failed to download image %s: %s", i+1, img_response.status_code)
+            img_response.close()
+            return None
+            
+        with open(img_path, 'wb') as f:
+            img_response.raw.decode_content = True
+            shutil.copyfileobj(img_response.raw, f, length=STREAM_CHUNK_SIZE)
+        
+        # Verify the image is valid and not empty
+        if not (os.path.exists(img_path) and os.path.getsize(img_path) > 1000):
+            logger.warning("Downloaded empty or too small image file for %s", i+1)
+            # Delete the file if it exists but is invalid
+            if os.path.exists(img_path):
+                os.remove(img_path)
+            return None
+            
+        if Image is not None:
+            # Try to validate image by opening it with PIL
+            try:
+                with Image.open(img_path) as img:
+                    # Check dimensions
+                    width, height = img.size
+            except Exception as img_err:
+                logger.warning("Invalid image file for %s: %s", i+1, img_err)
+                # Delete the invalid image file
+                if os.path.exists(img_path):
+                    os.remove(img_path)
+                return None
+                
+            if width < 50 or height < 50:
+                logger.warning("Image %s too small: %sx%s, skipping", i+1, width, height)
+                os.remove(img_path)
+                return None
+                
+            logger.info("Downloaded image %s/%s (%sx%spx)", i+1, total, width, height)
+            return img_path
+            
+        # If PIL is not installed, fall back to basic size check
+        if os.path.getsize(img_path) > 5000:  # Assume it's valid if > 5KB
+            logger.info("Downloaded image %s/%s (basic validation)", i+1, total)
+            return img_path
+            
+        logger.warning("Image file too small, likely invalid: %s", img_path)
+        os.remove(img_path)
+        return None
+    except Exception as e:
+        logger.warning("Error downloading image %s: %s", i+1, e)
+        # Clean up any partially downloaded file
+        if os.path.exists(img_path):
+            os.remove(img_path)
+        return None
+
+def _download_slideshow_audio(audio_url, audio_path, headers):
+    """
+    Download the audio track of a slideshow.
+    
+    Args:
+        audio_url (str): URL of the audio track
+        audio_path (str): Path to save the audio to
+        headers (dict): Request headers
+        
+    Returns:
+        str: Path to the audio file or None if it could not be downloaded
+    """
+    try:
+        audio_response = _SESSION.get(audio_url, headers=headers, stream=True)
+        if audio_response.status_code != 200:
+            logger.warning("Failed to download audio: %s", audio_response.status_code)
+            audio_response.close()
+            return None
+            
+        with open(audio_path, 'wb') as f:
+            audio_response.raw.decode_content = True
+            shutil.copyfileobj(audio_response.raw, f, length=STREAM_CHUNK_SIZE)
+        logger.info("Downloaded audio track")
+        return audio_path
+    except Exception as e:
+        logger.warning("Error downloading audio: %s", e)
         return None
 
 async def download_tiktok_slideshow(url):
@@ -342,52 +1246,27 @@ async def download_tiktok_slideshow(url):
         dict: Dictionary with 'images' (list of paths to image files) and 'audio' (path to audio file or None)
               Returns None if download fails completely
     """
-    logger.info(f"Downloading TikTok slideshow from: {url}")
+    logger.info("Downloading TikTok slideshow from: %s", url)
     
     try:
-        import requests
-        import shutil
-        from PIL import Image
-        import time
-        import re
-        
         # Create a unique directory for this slideshow
-        timestamp = int(time.time())
-        slideshow_dir = os.path.join(DOWNLOAD_DIR, f"tiktok_slideshow_{timestamp}")
+        slideshow_dir = os.path.join(DOWNLOAD_DIR, unique_name('tiktok_slideshow'))
         os.makedirs(slideshow_dir, exist_ok=True)
         
         # Get cookies and headers to access TikTok content
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Referer': 'https://www.tiktok.com/',
-            'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache'
-        }
+        headers = _TIKTOK_SLIDESHOW_HEADERS
         
         # Normalize the URL if it's shortened
-        try:
-            if ('vm.tiktok.com' in url.lower() or 
-                'vt.tiktok.com' in url.lower()):
-                response = requests.head(url, headers=headers, allow_redirects=True)
-                if response.status_code == 200:
-                    url = response.url
-                    logger.info(f"Resolved shortened URL to: {url}")
-        except Exception as e:
-            logger.warning(f"Error following TikTok redirect: {e}")
+        url = await _normalize_tiktok_url(url)
         
         # Fetch the TikTok page to extract image URLs and audio URL
-        response = requests.get(url, headers=headers)
+        response = await _fetch_tiktok_page(url, headers)
         if response.status_code != 200:
-            logger.error(f"Failed to fetch TikTok page: {response.status_code}")
+            logger.error("Failed to fetch TikTok page: %s", response.status_code)
             return None
             
         # Add debug output to analyze page content
-        logger.info(f"Got TikTok page response, length: {len(response.text)} bytes")
+        logger.info("Got TikTok page response, length: %s bytes", len(response.text))
         
         # Check for keywords in page content to verify it's a slideshow
         slideshow_indicators = ['/photo/', 'photo-mode', 'photoMode', 'carousel', 'slide', 'gallery']
@@ -395,7 +1274,7 @@ async def download_tiktok_slideshow(url):
         for indicator in slideshow_indicators:
             if indicator in response.text:
                 found_indicator = indicator
-                logger.info(f"Confirmed TikTok slideshow by finding '{indicator}' in page content")
+                logger.info("Confirmed TikTok slideshow by finding '%s' in page content", indicator)
                 break
                 
         if not found_indicator:
@@ -403,141 +1282,93 @@ async def download_tiktok_slideshow(url):
             # Continue anyway as we might still find images
             
         # Parse the HTML to extract image URLs and audio URL
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(response.content, HTML_PARSER, from_encoding=response.encoding,
+                             parse_only=SLIDESHOW_STRAINER)
         
         # Try multiple methods to extract image URLs from the page
-        image_urls = []
+        # Insertion-ordered dict used as an ordered set of candidate image URLs
+        image_urls = {}
         
         # Method 1: Extract from meta tags
         for meta in soup.find_all('meta', property='og:image'):
             if 'content' in meta.attrs and meta['content'] not in image_urls:
-                image_urls.append(meta['content'])
-                logger.info(f"Found image URL in meta tag: {meta['content']}")
-        
-        # Method 2: Try to extract from JSON data embedded in the page
-        for script in soup.find_all('script'):
-            if script.string:
-                # Look for various patterns in TikTok's JavaScript data
-                patterns = [
-                    'window.__INIT_PROPS__', 
-                    'window.SIGI_STATE', 
-                    'window.__NEXT_DATA__',
-                    '"images":', 
-                    '"imageList":', 
-                    '"imagePostInfo":'
-                ]
-                
-                for pattern in patterns:
-                    if pattern in script.string:
+                image_urls[meta['content']] = None
+                logger.info("Found image URL in meta tag: %s", meta['content'])
+        
+        # Method 2: Try to extract from JSON data embedded in the page.
+        # TikTok ships its page state as JSON in script tags with well-known ids, so parse those directly
+        state_scripts = [script for script in soup.find_all('script', id=_STATE_SCRIPT_IDS) if script.string]
+        for script in state_scripts:
+            try:
+                data = _json_loads(script.get_text())
+                photo_urls = _image_post_urls(data)
+                if photo_urls:
+                    logger.info("Found %s photo URLs in %s imagePostInfo", len(photo_urls), script.get('id'))
+                    image_urls.update(dict.fromkeys(photo_urls))
+                else:
+                    _extract_image_urls(data, image_urls)
+            except Exception as e:
+                logger.warning("Failed to parse %s JSON data: %s", script.get('id'), e)
+        
+        if not state_scripts:
+            # Fall back to scanning every script for embedded JSON objects
+            for script in soup.find_all('script'):
+                if script.string:
+                    # Look for TikTok's embedded JavaScript data
+                    if _SCRIPT_DATA_MARKER_RE.search(script.string):
                         try:
-                            import json
-                            import re
-                            
                             # Try to find JSON data in the script
-                            json_matches = re.findall(r'(\{.*\})', script.string)
-                            for json_text in json_matches:
+                            for json_text in _iter_json_objects(script.string):
                                 try:
-                                    data = json.loads(json_text)
-                                    
-                                    # Search for image URLs in the JSON structure
-                                    def extract_image_urls(obj, found_urls=None):
-                                        if found_urls is None:
-                                            found_urls = []
-                                        
-                                        if isinstance(obj, dict):
-                                            # Check for common keys that might contain image URLs
-                                            for key in ['images', 'imageList', 'imagePostInfo', 'imageUrl', 'displayImage', 'thumbnailUrl']:
-                                                if key in obj and isinstance(obj[key], list):
-                                                    for item in obj[key]:
-                                                        if isinstance(item, str) and item.startswith('http') and 'image' in item.lower():
-                                                            if item not in found_urls:
-                                                                found_urls.append(item)
-                                                                logger.info(f"Found image URL in JSON data (list): {item}")
-                                                elif key in obj and isinstance(obj[key], str) and obj[key].startswith('http'):
-                                                    if obj[key] not in found_urls:
-                                                        found_urls.append(obj[key])
-                                                        logger.info(f"Found image URL in JSON data (string): {obj[key]}")
-                                            
-                                            # Recursively search in all dictionary values
-                                            for value in obj.values():
-                                                extract_image_urls(value, found_urls)
-                                        
-                                        elif isinstance(obj, list):
-                                            # Recursively search in all list items
-                                            for item in obj:
-                                                extract_image_urls(item, found_urls)
-                                        
-                                        return found_urls
-                                    
-                                    # Extract image URLs from JSON
-                                    found_urls = extract_image_urls(data)
-                                    for url in found_urls:
-                                        if url not in image_urls:
-                                            image_urls.append(url)
-                                except:
+                                    data = _json_loads(json_text)
+                                    _extract_image_urls(data, image_urls)
+                                except (ValueError, KeyError, TypeError):
                                     # Skip invalid JSON
                                     pass
                         except Exception as e:
-                            logger.warning(f"Failed to parse JSON data: {e}")
-        
-        # Method 3: Look for image URLs in srcset attributes
-        for img in soup.find_all('img'):
-            if 'src' in img.attrs and img['src'].startswith('http'):
-                if img['src'] not in image_urls:
-                    image_urls.append(img['src'])
-                    logger.info(f"Found image URL in img src: {img['src']}")
+                            logger.warning("Failed to parse JSON data: %s", e)
+        
+        # Method 3: Look for image URLs in img src and srcset attributes
+        for img_tag in _IMG_TAG_RE.findall(response.text):
+            src_match = _IMG_SRC_RE.search(img_tag)
+            if src_match:
+                src = html.unescape(src_match.group(2))
+                if src.startswith('http') and src not in image_urls:
+                    image_urls[src] = None
+                    logger.info("Found image URL in img src: %s", src)
             
-            if 'srcset' in img.attrs:
+            srcset_match = _IMG_SRCSET_RE.search(img_tag)
+            if srcset_match:
                 # Parse the srcset attribute which contains multiple URL-size pairs
-                srcset_urls = img['srcset'].split(',')
+                srcset_urls = html.unescape(srcset_match.group(2)).split(',')
                 for srcset_url in srcset_urls:
                     parts = srcset_url.strip().split(' ')
                     if parts and parts[0].startswith('http'):
                         if parts[0] not in image_urls:
-                            image_urls.append(parts[0])
-                            logger.info(f"Found image URL in srcset: {parts[0]}")
+                            image_urls[parts[0]] = None
+                            logger.info("Found image URL in srcset: %s", parts[0])
         
         # Method 4: Look for urls in background-image styles
-        for element in soup.find_all(style=True):
-            style = element['style']
-            if 'background-image' in style and 'url(' in style:
-                matches = re.findall(r'url\([\'"]?(.*?)[\'"]?\)', style)
-                for match in matches:
-                    if match.startswith('http') and match not in image_urls:
-                        image_urls.append(match)
-                        logger.info(f"Found image URL in background-image: {match}")
+        for match in _BG_IMAGE_RE.findall(response.text):
+            match = html.unescape(match)
+            if match.startswith('http') and match not in image_urls:
+                image_urls[match] = None
+                logger.info("Found image URL in background-image: %s", match)
         
         # If we still don't have images, try a more aggressive approach
         if not image_urls:
             logger.info("No images found with initial methods, trying more aggressive approach")
             
-            # Special TikTok image patterns - they don't always use clear .jpg extensions in URLs
-            tiktok_image_patterns = [
-                r'(https?://[^"\'>\s]+\.image[^"\'>\s]*)',
-                r'(https?://[^"\'>\s]+\.tiktokcdn[^"\'>\s]*)',
-                r'(https://[^"\'>\s]+\.tiktok\.com/[^"\'>\s]+)',
-                r'property="og:image"\s+content="([^"]+)"',
-                r'<img[^>]+src="([^"]+)"',
-                r'"image":"([^"]+)"',
-                r'"images":\s*\[\s*"([^"]+)"',
-                r'"imageList":\s*\[\s*"([^"]+)"',
-                r'"imagePostInfo":[^{]*"url":"([^"]+)"',
-                r'"originCover":"([^"]+)"',
-                r'"thumbnailUrl":"([^"]+)"',
-                r'"imageUrl":"([^"]+)"',
-                r'"animatedCoverUrl":"([^"]+)"'
-            ]
+            # One pass over the page, bucketed by pattern so the patterns keep their priority
+            matches_by_pattern = [[] for _ in _TIKTOK_IMAGE_PATTERNS]
+            for match in _TIKTOK_IMAGE_RE.finditer(response.text):
+                matches_by_pattern[int(match.lastgroup[1:])].append(match.group(match.lastindex + 1))
             
-            for pattern in tiktok_image_patterns:
+            for pattern, matches in zip(_TIKTOK_IMAGE_PATTERNS, matches_by_pattern):
                 try:
-                    matches = re.findall(pattern, response.text)
-                    for match in matches:
-                        image_url = match
-                        if isinstance(match, tuple) and len(match) > 0:
-                            image_url = match[0]
-                        
+                    for image_url in matches:
                         # Clean up the URL - TikTok often has escaped URLs
-                        image_url = image_url.replace('\\u002F', '/').replace('\\/', '/').replace('\\', '')
+                        image_url = _ESCAPED_SLASH_RE.sub('/', image_url).replace('\\', '')
                         
                         # Add https:// if it's missing
                         if image_url.startswith('//'):
@@ -549,28 +1380,27 @@ async def download_tiktok_slideshow(url):
                                 'tiktok' in image_url.lower() or 
                                 any(ext in image_url.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp'])):
                             if image_url not in image_urls:
-                                image_urls.append(image_url)
-                                logger.info(f"Found image URL with pattern {pattern}: {image_url}")
+                                image_urls[image_url] = None
+                                logger.info("Found image URL with pattern %s: %s", pattern.pattern, image_url)
                             
                     # If we've found at least 2 images, that's probably good enough
                     if len(image_urls) >= 2:
-                        logger.info(f"Found {len(image_urls)} image URLs, proceeding with download")
+                        logger.info("Found %s image URLs, proceeding with download", len(image_urls))
                         break
                 except Exception as e:
-                    logger.warning(f"Error extracting image URLs with pattern {pattern}: {e}")
+                    logger.warning("Error extracting image URLs with pattern %s: %s", pattern.pattern, e)
             
             # If still no images, try the generic approach
             if not image_urls:
                 try:
-                    url_pattern = r'(https?://[^\s\'"\)]+\.(jpg|jpeg|png|webp))'
-                    matches = re.findall(url_pattern, response.text)
+                    matches = _GENERIC_IMAGE_URL_RE.findall(response.text)
                     for match in matches:
                         full_url = match[0]  # Get the full URL from the match
                         if full_url not in image_urls:
-                            image_urls.append(full_url)
-                            logger.info(f"Found image URL with generic regex: {full_url}")
+                            image_urls[full_url] = None
+                            logger.info("Found image URL with generic regex: %s", full_url)
                 except Exception as e:
-                    logger.warning(f"Error extracting image URLs with generic regex: {e}")
+                    logger.warning("Error extracting image URLs with generic regex: %s", e)
                     
             # Fallback extraction method - use a direct approach when nothing else works
             if not image_urls:
@@ -578,166 +1408,80 @@ async def download_tiktok_slideshow(url):
                 try:
                     # Extract the item_id from the URL which is needed for the API
                     item_id = None
-                    item_id_pattern = r'photo/(\d+)'
-                    item_id_match = re.search(item_id_pattern, url)
+                    item_id_match = _PHOTO_ITEM_ID_RE.search(url)
                     if item_id_match:
                         item_id = item_id_match.group(1)
                     
                     # If we have an item_id, we can try the direct TikTok API approach
                     if item_id:
-                        logger.info(f"Found item_id: {item_id}, trying direct API")
+                        logger.info("Found item_id: %s, trying direct API", item_id)
                         # This is a fallback approach using TikTok's public API
                         api_url = f"https://api.tiktok.com/aweme/v1/multi/aweme/detail/?aweme_ids=%5B{item_id}%5D"
-                        api_headers = {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                            'Referer': 'https://www.tiktok.com/',
-                            'Accept': 'application/json'
-                        }
-                        api_response = requests.get(api_url, headers=api_headers)
+                        api_response = await asyncio.to_thread(_SESSION.get, api_url, headers=_TIKTOK_API_HEADERS)
                         if api_response.status_code == 200:
                             try:
-                                data = api_response.json()
-                                # Recursively search for image URLs in the API response
-                                if 'aweme_details' in data and data['aweme_details']:
-                                    for detail in data['aweme_details']:
-                                        if 'image_post_info' in detail and detail['image_post_info']:
-                                            images_data = detail['image_post_info'].get('images', [])
-                                            for img in images_data:
-                                                if 'display_image' in img and img['display_image']:
-                                                    image_url = img['display_image'].get('url_list', [])[0]
-                                                    if image_url and image_url not in image_urls:
-                                                        image_urls.append(image_url)
-                                                        logger.info(f"Found image URL from API: {image_url}")
+                                data = _json_loads(api_response.content)
+                                for image_url in _aweme_detail_image_urls(data):
+                                    image_urls[image_url] = None
+                                    logger.info("Found image URL from API: %s", image_url)
                             except Exception as e:
-                                logger.warning(f"Error parsing TikTok API response: {e}")
+                                logger.warning("Error parsing TikTok API response: %s", e)
                 except Exception as e:
-                    logger.warning(f"Error with direct API extraction: {e}")
+                    logger.warning("Error with direct API extraction: %s", e)
         
         # Extract audio URL - try multiple methods
         audio_url = None
-        # Method 1: Check meta tags
-        for meta in soup.find_all('meta', property='og:audio'):
-            if 'content' in meta.attrs:
-                audio_url = meta['content']
-                logger.info(f"Found audio URL in meta tag: {audio_url}")
-                break
+        # Method 1: Check meta tags (find stops at the first matching tag)
+        meta = soup.find('meta', property='og:audio', content=True)
+        if meta:
+            audio_url = meta['content']
+            logger.info("Found audio URL in meta tag: %s", audio_url)
         
         # Method 2: Look for audio tags
         if not audio_url:
-            for audio in soup.find_all('audio'):
-                if 'src' in audio.attrs and audio['src'].startswith('http'):
-                    audio_url = audio['src']
-                    logger.info(f"Found audio URL in audio tag: {audio_url}")
-                    break
+            audio = soup.find('audio', src=_HTTP_URL_RE)
+            if audio:
+                audio_url = audio['src']
+                logger.info("Found audio URL in audio tag: %s", audio_url)
         
         # Method 3: Look for audio URLs in the page source
         if not audio_url:
-            audio_patterns = [
-                r'(https?://[^\s\'"\)]+\.(mp3|m4a|aac|wav))',
-                r'"musicUrl"\s*:\s*"([^"]+)"',
-                r'"audioUrl"\s*:\s*"([^"]+)"',
-                r'"audio_url"\s*:\s*"([^"]+)"',
-                r'"music":[^}]*"playUrl"\s*:\s*"([^"]+)"',
-                r'"audio":[^}]*"url"\s*:\s*"([^"]+)"',
-                r'"soundtrack":[^}]*"url"\s*:\s*"([^"]+)"'
-            ]
-            for pattern in audio_patterns:
-                matches = re.findall(pattern, response.text)
-                if matches:
-                    if isinstance(matches[0], tuple):
-                        # If the match is a tuple (from the URL pattern), get the full URL
-                        audio_url = matches[0][0]
-                    else:
-                        # For other patterns that capture just the URL in a group
-                        audio_url = matches[0]
-                    logger.info(f"Found audio URL with regex: {audio_url}")
-                    break
+            audio_url = _find_audio_url(response.text)
+            if audio_url:
+                logger.info("Found audio URL with regex: %s", audio_url)
                 
         if not image_urls:
             logger.error("Failed to extract image URLs from TikTok page")
             return None
+        image_urls = list(image_urls)
             
-        # Download images
-        image_paths = []
-        valid_image_count = 0
-        for i, img_url in enumerate(image_urls):
-            try:
-                img_path = os.path.join(slideshow_dir, f"image_{i}.jpg")
-                img_response = requests.get(img_url, headers=headers, stream=True)
-                if img_response.status_code == 200:
-                    with open(img_path, 'wb') as f:
-                        img_response.raw.decode_content = True
-                        shutil.copyfileobj(img_response.raw, f)
-                    
-                    # Verify the image is valid and not empty
-                    if os.path.exists(img_path) and os.path.getsize(img_path) > 1000:
-                        try:
-                            # Try to validate image by opening it with PIL
-                            from PIL import Image
-                            try:
-                                img = Image.open(img_path)
-                                # Check dimensions
-                                width, height = img.size
-                                if width < 50 or height < 50:
-                                    logger.warning(f"Image {i+1} too small: {width}x{height}, skipping")
-                                    os.remove(img_path)
-                                    continue
-                                    
-                                # Close the image
-                                img.close()
-                                
-                                # If we get here, the image is valid
-                                image_paths.append(img_path)
-                                valid_image_count += 1
-                                logger.info(f"Downloaded image {i+1}/{len(image_urls)} ({width}x{height}px)")
-                            except Exception as img_err:
-                                logger.warning(f"Invalid image file for {i+1}: {img_err}")
-                                # Delete the invalid image file
-                                if os.path.exists(img_path):
-                                    os.remove(img_path)
-                        except ImportError:
-                            # If PIL is not installed, fall back to basic size check
-                            if os.path.getsize(img_path) > 5000:  # Assume it's valid if > 5KB
-                                image_paths.append(img_path)
-                                valid_image_count += 1
-                                logger.info(f"Downloaded image {i+1}/{len(image_urls)} (basic validation)")
-                            else:
-                                logger.warning(f"Image file too small, likely invalid: {img_path}")
-                                if os.path.exists(img_path):
-                                    os.remove(img_path)
-                    else:
-                        logger.warning(f"Downloaded empty or too small image file for {i+1}")
-                        # Delete the file if it exists but is invalid
-                        if os.path.exists(img_path):
-                            os.remove(img_path)
-                else:
-                    logger.warning(f"Failed to download image {i+1}: {img_response.status_code}")
-            except Exception as e:
-                logger.warning(f"Error downloading image {i+1}: {e}")
-                # Clean up any partially downloaded file
-                if os.path.exists(img_path):
-                    os.remove(img_path)
-                    
-        # Log the actual number of valid images
-        logger.info(f"Successfully validated {valid_image_count} of {len(image_urls)} images")
+        # Pillow is optional and only needed to validate downloaded images
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = None
+        
+        # Download all images and the audio track concurrently
+        audio_path = os.path.join(slideshow_dir, "audio.mp3") if audio_url else None
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=SLIDESHOW_DOWNLOAD_WORKERS) as pool:
+            jobs = [
+                loop.run_in_executor(
+                    pool, _download_slideshow_image, img_url,
+                    os.path.join(slideshow_dir, f"image_{i}.jpg"), headers, i, len(image_urls), Image
+                )
+                for i, img_url in enumerate(image_urls)
+            ]
+            if audio_url:
+                jobs.append(loop.run_in_executor(pool, _download_slideshow_audio, audio_url, audio_path, headers))
+            results = await asyncio.gather(*jobs)
         
-        # Download audio if available
-        audio_path = None
+        image_paths = [path for path in results[:len(image_urls)] if path]
         if audio_url:
-            try:
-                audio_path = os.path.join(slideshow_dir, "audio.mp3")
-                audio_response = requests.get(audio_url, headers=headers, stream=True)
-                if audio_response.status_code == 200:
-                    with open(audio_path, 'wb') as f:
-                        audio_response.raw.decode_content = True
-                        shutil.copyfileobj(audio_response.raw, f)
-                    logger.info("Downloaded audio track")
-                else:
-                    logger.warning(f"Failed to download audio: {audio_response.status_code}")
-                    audio_path = None
-            except Exception as e:
-                logger.warning(f"Error downloading audio: {e}")
-                audio_path = None
+            audio_path = results[-1]
+                    
+        # Log the actual number of valid images
+        logger.info("Successfully validated %s of %s images", len(image_paths), len(image_urls))
         
         # Return the images and audio without creating a video
         if not image_paths:
@@ -745,7 +1489,7 @@ async def download_tiktok_slideshow(url):
             return None
             
         # Now instead of creating a video, return the individual files
-        logger.info(f"Successfully downloaded {len(image_paths)} images and audio: {audio_path is not None}")
+        logger.info("Successfully downloaded %s images and audio: %s", len(image_paths), audio_path is not None)
         
         result = {
             'images': image_paths,
@@ -754,16 +1498,341 @@ async def download_tiktok_slideshow(url):
         
         return result
         
-    except ImportError as e:
-        logger.error(f"Required library missing: {e}")
+    except Exception as e:
+        logger.error("Error creating TikTok slideshow video: %s", e)
         return None
+
+async def _download_tiktok_from_page(url, cancel=None):
+    """
+    TikTok fallback: download the first working mp4 URL found in the video page.
+    
+    Args:
+        url (str): TikTok video URL
+        cancel (_CancelToken): Optional token that stops the download and claims its file
+        
+    Returns:
+        str: Path to the downloaded video or None if download fails
+    """
+    try:
+        # Simple implementation to avoid any dependency issues
+        headers = _TIKTOK_FALLBACK_HEADERS
+        
+        # Try to get the video page
+        response = await asyncio.to_thread(_SESSION.get, url, headers=headers, timeout=30)
+        if response.status_code == 200:
+            # Look for video URLs in the page
+            matches = _find_mp4_urls(response.text)
+            
+            for match in matches:
+                try:
+                    video_url = _ESCAPED_SLASH_RE.sub('/', match)
+                    logger.info("Found direct video URL: %s", video_url)
+                    
+                    # Download the video
+                    output_path = os.path.join(DOWNLOAD_DIR, f"{unique_name('tiktok_fallback')}.mp4")
+                    
+                    await asyncio.to_thread(_stream_to_file, video_url, output_path, headers, cancel=cancel)
+                    
+                    if os.path.getsize(output_path) > MIN_VIDEO_BYTES:  # Check file is not empty
+                        logger.info("Successfully downloaded TikTok video directly: %s", output_path)
+                        return output_path
+                    _remove_file(output_path)
+                except _DownloadCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning("Error downloading from found URL: %s", e)
+    
+    except _DownloadCancelled:
+        logger.info("Direct page download of %s was cancelled", url)
     except Exception as e:
-        logger.error(f"Error creating TikTok slideshow video: {e}")
+        logger.error("Error in direct TikTok download: %s", e)
+    
+    return None
+
+async def _download_tiktok_savefrom(url, cancel=None):
+    """
+    TikTok fallback: download the video through the SaveFrom page.
+    
+    Args:
+        url (str): TikTok video URL
+        cancel (_CancelToken): Optional token that stops the download and claims its file
+        
+    Returns:
+        str: Path to the downloaded video or None if download fails
+    """
+    try:
+        savefrom_url = f"https://en.savefrom.net/download-from-tiktok/#url={url}"
+        headers = _SAVEFROM_HEADERS
+        
+        response = await asyncio.to_thread(_SESSION.get, savefrom_url, headers=headers)
+        if response.status_code == 200:
+            matches = _find_mp4_urls(response.text)
+            
+            for match in matches:
+                try:
+                    output_path = os.path.join(DOWNLOAD_DIR, f"{unique_name('tiktok_savefrom')}.mp4")
+                    
+                    await asyncio.to_thread(_stream_to_file, match, output_path, headers, cancel=cancel)
+                            
+                    if os.path.getsize(output_path) > MIN_VIDEO_BYTES:
+                        logger.info("Successfully downloaded TikTok video with SaveFrom: %s", output_path)
+                        return output_path
+                    _remove_file(output_path)
+                except _DownloadCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning("Error with SaveFrom API download: %s", e)
+                    continue
+    except _DownloadCancelled:
+        logger.info("SaveFrom download of %s was cancelled", url)
+    except Exception as e:
+        logger.error("Error in SaveFrom TikTok download: %s", e)
+    
+    return None
+
+# TikTok API hosts whose primary yt-dlp attempt was recently refused (HTTP 403/429),
+# mapped to the time the block expires. While a host is blocked, downloads start
+# with the fallback extractor instead of waiting out the primary's retries.
+TIKTOK_API_HOSTNAME = PLATFORM_YDL_OPTIONS['tiktok']['extractor_args']['tiktok']['api_hostname']
+TIKTOK_HOST_FAILURE_TTL = 600  # 10 minutes
+_TIKTOK_BLOCKED_STATUS_RE = re.compile(r'HTTP Error (?:403|429)')
+_tiktok_host_failures = {}
+_tiktok_host_failures_lock = threading.Lock()
+
+def _tiktok_host_blocked(host):
+    """Check whether a TikTok API host recently refused a download."""
+    with _tiktok_host_failures_lock:
+        expiry = _tiktok_host_failures.get(host)
+        if expiry is None:
+            return False
+        if expiry <= time.time():
+            del _tiktok_host_failures[host]
+            return False
+        return True
+
+def _record_tiktok_host_failure(host, error):
+    """
+    Remember a TikTok API host as blocked if the download error was a 403 or 429.
+    
+    Args:
+        host (str): API hostname the failed attempt used
+        error (Exception): Error raised by yt-dlp
+    """
+    if not _TIKTOK_BLOCKED_STATUS_RE.search(str(error)):
+        return
+    logger.warning("TikTok API host %s refused the download, skipping it for %ss", host, TIKTOK_HOST_FAILURE_TTL)
+    with _tiktok_host_failures_lock:
+        _tiktok_host_failures[host] = time.time() + TIKTOK_HOST_FAILURE_TTL
+
+# Set TIKTOK_SERIAL_FALLBACKS=1 to try the TikTok fallbacks one after another (useful for debugging)
+TIKTOK_SERIAL_FALLBACKS = os.environ.get('TIKTOK_SERIAL_FALLBACKS') == '1'
+# Upper bound for a single fallback attempt, including its video download
+TIKTOK_FALLBACK_TIMEOUT = int(os.environ.get('TIKTOK_FALLBACK_TIMEOUT', 90))
+# Anything smaller than this is an error page or an empty body, not a video
+MIN_VIDEO_BYTES = 10000
+
+def _is_usable_download(path):
+    """Check that a fallback produced a file big enough to be a real video, deleting it if not."""
+    if not path or not os.path.exists(path):
+        return False
+    if os.path.getsize(path) > MIN_VIDEO_BYTES:
+        return True
+    _remove_file(path)
+    return False
+
+async def _run_fallback(name, start, cancel):
+    """Run one fallback attempt under TIKTOK_FALLBACK_TIMEOUT, cancelling its work on timeout."""
+    try:
+        return await asyncio.wait_for(start(cancel), TIKTOK_FALLBACK_TIMEOUT)
+    except asyncio.TimeoutError:
+        cancel.cancel()
+        raise asyncio.TimeoutError(f"timed out after {TIKTOK_FALLBACK_TIMEOUT}s") from None
+
+async def _first_successful_download(attempts):
+    """
+    Run download attempts and return the first file one of them produces.
+    
+    Attempts run concurrently and the rest are cancelled once one succeeds, so
+    the wait is bounded by the fastest working method rather than the sum of
+    every method's timeouts. Each attempt is capped at TIKTOK_FALLBACK_TIMEOUT seconds
+    and only counts if it produces more than MIN_VIDEO_BYTES. With
+    TIKTOK_SERIAL_FALLBACKS set they run in order.
+    
+    Every attempt gets its own _CancelToken. Losing and timed-out attempts are
+    cancelled through it, which stops their worker threads and deletes any file
+    they produce.
+    
+    Args:
+        attempts (list): (name, start) pairs, where start(cancel) returns an awaitable
+            resolving to a file path or None
+        
+    Returns:
+        str: Path to the downloaded file or None if every attempt fails
+    """
+    if TIKTOK_SERIAL_FALLBACKS:
+        for name, start in attempts:
+            logger.info("Trying TikTok fallback: %s", name)
+            try:
+                path = await _run_fallback(name, start, _CancelToken())
+            except Exception as e:
+                logger.warning("TikTok fallback %s failed: %s", name, e)
+                continue
+            if _is_usable_download(path):
+                return path
         return None
+    
+    names = {}
+    tokens = {}
+    for name, start in attempts:
+        cancel = _CancelToken()
+        task = asyncio.ensure_future(_run_fallback(name, start, cancel))
+        names[task] = name
+        tokens[task] = cancel
+    logger.info("Racing TikTok fallbacks: %s", ', '.join(names.values()))
+    pending = set(names)
+    winner = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning("TikTok fallback %s failed: %s", names[task], task.exception())
+                    continue
+                path = task.result()
+                if _is_usable_download(path):
+                    logger.info("TikTok fallback %s succeeded", names[task])
+                    winner = path
+                    return path
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        for cancel in tokens.values():
+            cancel.cancel(keep=winner)
+
+# Downloads currently in progress, keyed by canonical URL.
+# Bot handlers run each download on its own thread and event loop, so waiters
+# share a thread-safe concurrent.futures.Future rather than an asyncio one.
+_inflight_downloads = {}
+_inflight_lock = threading.Lock()
+
+# Share/tracking query parameters that never change which media a URL points to
+_TRACKING_PARAMS = frozenset({
+    'igsh', 'igshid', 'si', 'feature', 'is_from_webapp', 'is_copy_url', 'sender_device',
+    'sender_web_id', 'share_app_id', 'share_item_id', 'share_link_id', 'social_sharing',
+    'source', 'tt_from', 'u_code', 'user_id', '_r', '_t', '_d',
+})
+
+def _canonical_url(url):
+    """Normalize a URL so equivalent submissions map to the same key."""
+    parsed = urllib.parse.urlparse(url.strip())
+    query = parsed.query
+    if query:
+        query = urllib.parse.urlencode([
+            (name, value) for name, value in urllib.parse.parse_qsl(query, keep_blank_values=True)
+            if name not in _TRACKING_PARAMS and not name.startswith('utm_')
+        ])
+    return parsed._replace(netloc=parsed.netloc.lower(), query=query, fragment='').geturl()
+
+# Persistent index of finished downloads so a URL that was already fetched (viral
+# links get shared a lot) is served from disk. Maps sha1(canonical URL) ->
+# [download result, expiry timestamp]. Entries whose files are gone are ignored.
+DOWNLOAD_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "downloads.json")
+DOWNLOAD_CACHE_TTL = 86400  # 24 hours
+DOWNLOAD_CACHE_MAX_ENTRIES = 512
+_download_cache_lock = threading.Lock()
+_download_cache = load_json_cache(DOWNLOAD_CACHE_FILE)
+
+def _download_cache_key(url):
+    """Build the download cache key for a URL."""
+    return hashlib.sha1(_canonical_url(url).encode()).hexdigest()
+
+def _result_files_exist(result):
+    """Check that every file referenced by a download result is still on disk."""
+    if isinstance(result, dict):
+        data = result.get('data') or {}
+        paths = list(data.get('images') or [])
+        if data.get('audio'):
+            paths.append(data['audio'])
+        return bool(paths) and all(os.path.exists(path) for path in paths)
+    return bool(result) and os.path.exists(result)
+
+def _get_cached_download(key):
+    """Return a cached download result whose files still exist, or None."""
+    with _download_cache_lock:
+        entry = _download_cache.get(key)
+    if entry and entry[1] > time.time() and _result_files_exist(entry[0]):
+        return entry[0]
+    return None
+
+def _store_cached_download(key, result):
+    """Remember a successful download result and persist the index."""
+    with _download_cache_lock:
+        _download_cache[key] = [result, time.time() + DOWNLOAD_CACHE_TTL]
+    save_json_cache(DOWNLOAD_CACHE_FILE, _download_cache, _download_cache_lock, DOWNLOAD_CACHE_MAX_ENTRIES)
+
+# Cap on downloads running at once across the whole process, so a burst of links
+# cannot launch dozens of yt-dlp jobs and scrapers. Every download runs in its own
+# thread and event loop, so this is a threading semaphore waited on from a worker
+# thread rather than an asyncio.Semaphore, which only works within a single loop.
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DL_CONCURRENCY', 4))
+_download_slots = threading.BoundedSemaphore(DOWNLOAD_CONCURRENCY)
+# Seconds a worker thread blocks on the semaphore per attempt, which bounds how
+# long it can outlive a cancelled wait
+DOWNLOAD_SLOT_WAIT = 1.0
+
+def _release_if_acquired(attempt):
+    """Hand back a slot that a cancelled wait's worker thread acquired after all."""
+    if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+        _download_slots.release()
+
+class _DownloadSlot:
+    """
+    A held download slot.
+    
+    release() frees it, unless release_after() handed it to work that keeps
+    running in the background; the slot is then freed when that work finishes.
+    """
+    def __init__(self):
+        self._deferred = False
+    
+    def release_after(self, future):
+        """Keep the slot until a concurrent.futures.Future is done, then release it."""
+        self._deferred = True
+        future.add_done_callback(lambda _: _download_slots.release())
+    
+    def release(self):
+        """Release the slot now, unless it was handed to background work."""
+        if not self._deferred:
+            _download_slots.release()
+
+async def _acquire_download_slot():
+    """
+    Wait for a free download slot without blocking the event loop.
+    
+    Returns:
+        _DownloadSlot: The acquired slot
+    """
+    if _download_slots.acquire(blocking=False):
+        return _DownloadSlot()
+    logger.info("All download slots are busy, waiting for one to free up")
+    while True:
+        attempt = asyncio.ensure_future(
+            asyncio.to_thread(_download_slots.acquire, timeout=DOWNLOAD_SLOT_WAIT)
+        )
+        try:
+            if await asyncio.shield(attempt):
+                return _DownloadSlot()
+        except asyncio.CancelledError:
+            attempt.add_done_callback(_release_if_acquired)
+            raise
 
 async def download_video(url):
     """
     Download video from supported social media platforms.
+    Recently downloaded URLs are served from the download cache, concurrent
+    requests for the same URL share a single download, and at most
+    DOWNLOAD_CONCURRENCY downloads run at once.
     
     Args:
         url (str): URL of the video to download
@@ -771,17 +1840,88 @@ async def download_video(url):
     Returns:
         str: Path to the downloaded video file or None if download fails
     """
-    logger.info(f"Downloading video from: {url}")
+    # Resolve short links first so every form of a link maps to the same cache entry
+    url = await _normalize_tiktok_url(url)
+    cache_key = _download_cache_key(url)
+    cached = _get_cached_download(cache_key)
+    if cached is not None:
+        logger.info("Serving %s from the download cache", url)
+        return cached
+    
+    key = _canonical_url(url)
+    with _inflight_lock:
+        future = _inflight_downloads.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = concurrent.futures.Future()
+            _inflight_downloads[key] = future
+    
+    if not is_owner:
+        logger.info("Download already in progress for %s, waiting for it to finish", url)
+        return await asyncio.wrap_future(future)
+    
+    result = None
+    try:
+        slot = await _acquire_download_slot()
+        try:
+            result = await _download_video(url, slot)
+        finally:
+            slot.release()
+        if result and _result_files_exist(result):
+            _store_cached_download(cache_key, result)
+        return result
+    finally:
+        with _inflight_lock:
+            del _inflight_downloads[key]
+        future.set_result(result)
+
+async def _try_tiktok_slideshow(url):
+    """
+    Detect and download a TikTok slideshow that has no explicit marker in its URL.
+    
+    Args:
+        url (str): TikTok URL
+        
+    Returns:
+        dict: Slideshow result for the bot, or None if the URL is not a slideshow
+            or the slideshow download fails
+    """
+    try:
+        is_slideshow = await is_tiktok_slideshow(url)
+        if is_slideshow:
+            logger.info("Detected TikTok slideshow, trying dedicated slideshow downloader")
+            slideshow_result = await download_tiktok_slideshow(url)
+            if slideshow_result and isinstance(slideshow_result, dict):
+                # Return dictionary with images and audio for separate handling by the bot
+                return {'type': 'slideshow', 'data': slideshow_result}
+            logger.warning("Slideshow download failed, falling back to regular video download")
+    except Exception as e:
+        logger.error("Error in TikTok slideshow detection: %s, continuing with regular video download", e)
+    return None
+
+async def _download_video(url, slot):
+    """
+    Download video from supported social media platforms.
+    
+    Args:
+        url (str): URL of the video to download
+        slot (_DownloadSlot): The caller's download slot, kept by any work left running
+        
+    Returns:
+        str: Path to the downloaded video file or None if download fails
+    """
+    logger.info("Downloading video from: %s", url)
     
     try:
         # First, check if this is a TikTok slideshow (image carousel)
         parsed_url = urllib.parse.urlparse(url)
-        domain = parsed_url.netloc.lower()
+        platform = _url_platform(parsed_url)
+        is_tiktok = platform == 'tiktok'
         
         # For TikTok URLs, perform more robust detection of slideshows
-        if 'tiktok' in domain:
+        if is_tiktok:
             # Special handling for obvious slideshow URLs first - don't even attempt video download
-            if '/photo/' in parsed_url.path.lower() or 'aweme_type=150' in url:
+            if _has_slideshow_url_markers(parsed_url):
                 logger.info("URL contains explicit slideshow indicators, using slideshow downloader directly")
                 slideshow_result = await download_tiktok_slideshow(url)
                 if slideshow_result:
@@ -789,108 +1929,28 @@ async def download_video(url):
                     return {'type': 'slideshow', 'data': slideshow_result}
                 logger.error("Direct slideshow download failed")
                 return None
-                
-            # For less obvious cases, perform additional detection
-            try:
-                is_slideshow = await is_tiktok_slideshow(url)
-                if is_slideshow:
-                    logger.info("Detected TikTok slideshow, trying dedicated slideshow downloader")
-                    slideshow_result = await download_tiktok_slideshow(url)
-                    if slideshow_result and isinstance(slideshow_result, dict):
-                        # Return dictionary with images and audio for separate handling by the bot
-                        return {'type': 'slideshow', 'data': slideshow_result}
-                    logger.warning("Slideshow download failed, falling back to regular video download")
-            except Exception as e:
-                logger.error(f"Error in TikTok slideshow detection: {e}, continuing with regular video download")
-        
-        # Determine platform-specific options
-        options = YDL_OPTIONS.copy()
-        
-        # Update options with better settings for reliability
-        options.update({
-            'socket_timeout': 60,  # Increased timeout
-            'retries': 5,          # More retries
-            'fragment_retries': 10, # For segmented downloads
-            'overwrites': True     # Overwrite existing files
-        })
-        
-        # Special handling for TikTok
-        if 'tiktok' in domain:
-            logger.info("Detected TikTok URL")
-            
-            # Normalize TikTok URL if it's a shortened one (vm.tiktok.com)
-            if 'vm.tiktok.com' in domain:
-                logger.info("Converting shortened TikTok URL to full URL")
-                try:
-                    import requests
-                    response = requests.head(url, allow_redirects=True)
-                    if response.status_code == 200:
-                        url = response.url
-                        logger.info(f"Resolved to: {url}")
-                        # Re-parse the URL after redirection
-                        parsed_url = urllib.parse.urlparse(url)
-                except Exception as e:
-                    logger.warning(f"Error following TikTok redirect: {e}")
-            
-            # Try a more reliable approach for TikTok - use multiple APIs and browser simulation
-            options.update({
-                # Enhanced options for TikTok
-                'extractor_retries': 5,  # Increase retry attempts
-                'socket_timeout': 60,    # Increase timeout for slow connections
-                'extractor_args': {
-                    'tiktok': {
-                        'embed_api': ['tiktokv', 'ssstik', 'tikwm', 'tikmate'],  # Try multiple API endpoints
-                        'api_hostname': 'tikmate.app',  # More reliable service
-                        'force_api_response': 'yes',
-                        'force_mobile_api': 'yes'  # Try mobile API which might be more reliable
-                    }
-                },
-                'referer': 'https://www.tiktok.com/',
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                    'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120"',
-                    'sec-ch-ua-mobile': '?0',
-                    'sec-ch-ua-platform': '"Windows"'
-                }
-            })
-            
-        elif 'instagram' in domain:
-            logger.info("Detected Instagram URL")
-            options.update({
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://www.instagram.com/'
-                }
-            })
-            
-        elif 'youtube' in domain or 'youtu.be' in domain:
-            logger.info("Detected YouTube URL")
-            # No special options needed, yt-dlp handles YouTube well by default
-            
-        elif 'pinterest' in domain:
-            logger.info("Detected Pinterest URL")
-            options.update({
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://www.pinterest.com/'
-                }
-            })
+        
+        if platform:
+            logger.info("Detected %s URL", _PLATFORM_NAMES[platform])
+        
+        # Start from the precomputed option template for the platform
+        options = {**DOWNLOAD_YDL_OPTIONS, **PLATFORM_YDL_OPTIONS.get(platform, {})}
             
-        # Generate a unique filename based on timestamp to prevent conflicts
-        import time
-        timestamp = int(time.time())
-        temp_filename = f"video_{timestamp}"
-        options['outtmpl'] = os.path.join(DOWNLOAD_DIR, f"{temp_filename}.%(ext)s")
+        # Go straight to the fallback extractor while the primary API host is refusing us
+        skip_primary = is_tiktok and _tiktok_host_blocked(TIKTOK_API_HOSTNAME)
+        if skip_primary:
+            logger.info("TikTok API host %s is blocked, starting with musicaldown API", TIKTOK_API_HOSTNAME)
+            options['extractor_args'] = TIKTOK_FALLBACK_EXTRACTOR_ARGS
         
         # Download the video using yt-dlp in a separate process
-        def download():
-            with yt_dlp.YoutubeDL(options) as ydl:
+        def download(ydl_options, cancel=None):
+            if cancel is not None:
+                cancel.check()
+            # yt-dlp works in a private directory (fragments, .part files, pre-merge
+            # streams); only the finished file is moved into DOWNLOAD_DIR
+            work_dir = tempfile.mkdtemp(prefix='ytdlp_', dir=DOWNLOAD_DIR)
+            pool_key, ydl = _acquire_ydl({**ydl_options, 'outtmpl': os.path.join(work_dir, '%(id)s.%(ext)s')}, cancel)
+            try:
                 info = ydl.extract_info(url, download=True)
                 if info is None:
                     return None
@@ -899,123 +1959,73 @@ async def download_video(url):
                     # Playlist or compilation video - take the first one
                     info = info['entries'][0]
                 
-                # Get the actual filename
-                for key in ['requested_downloads', '_filename']:
-                    if key in info and info[key]:
-                        if key == 'requested_downloads':
-                            return info[key][0]['filepath']
-                        return info[key]
-                        
-                # Fallback - construct filename from template and extension
-                filename = f"{temp_filename}.{info.get('ext', 'mp4')}"
-                return os.path.join(DOWNLOAD_DIR, filename)
+                # requested_downloads holds the final (post-merge) path; otherwise let yt-dlp build it
+                if info.get('requested_downloads'):
+                    src = info['requested_downloads'][0]['filepath']
+                else:
+                    src = ydl.prepare_filename(info)
+                if not os.path.exists(src):
+                    return None
+                
+                # Same filesystem, so the rename is atomic
+                video_path = os.path.join(DOWNLOAD_DIR, unique_name('video') + os.path.splitext(src)[1])
+                os.rename(src, video_path)
+                return cancel.claim(video_path) if cancel is not None else video_path
+            finally:
+                _release_ydl(pool_key, ydl)
+                shutil.rmtree(work_dir, ignore_errors=True)
         
         # Run the download in a separate thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        video_path = await loop.run_in_executor(None, download)
+        loop = asyncio.get_running_loop()
+        video_cancel = _CancelToken()
+        video_future = YTDLP_EXECUTOR.submit(download, options, video_cancel)
         
-        # If TikTok download failed, try multiple fallback methods
-        if (not video_path or not os.path.exists(video_path)) and 'tiktok' in domain:
-            logger.info("Initial TikTok download failed, trying first fallback method...")
-            
-            # Try first fallback method with a different API
-            options['extractor_args']['tiktok'] = {
-                'embed_api': 'musicaldown',
-                'api_hostname': 'musicaldown.com',
-                'force_mobile_api': 'yes'
-            }
-            
-            video_path = await loop.run_in_executor(None, download)
-            
-            # If first fallback fails, try a direct request method (bypass yt-dlp)
-            if not video_path or not os.path.exists(video_path):
-                logger.info("Second fallback: Trying direct download method for TikTok...")
-                try:
-                    # Simple implementation to avoid any dependency issues
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Accept': '*/*',
-                        'Referer': 'https://www.tiktok.com/',
-                    }
-                    
-                    # Try to get the video page
-                    response = requests.get(url, headers=headers, timeout=30)
-                    if response.status_code == 200:
-                        # Look for video URLs in the page
-                        video_pattern = r'(https://[^"\']+\.mp4[^"\']*)'
-                        matches = re.findall(video_pattern, response.text)
-                        
-                        for match in matches:
-                            try:
-                                video_url = match.replace('\\u002F', '/').replace('\\/', '/')
-                                logger.info(f"Found direct video URL: {video_url}")
-                                
-                                # Download the video
-                                timestamp = int(time.time())
-                                output_path = os.path.join(DOWNLOAD_DIR, f"tiktok_fallback_{timestamp}.mp4")
-                                
-                                with requests.get(video_url, stream=True, headers=headers, timeout=60) as dl_response:
-                                    if dl_response.status_code == 200:
-                                        with open(output_path, 'wb') as f:
-                                            for chunk in dl_response.iter_content(chunk_size=8192):
-                                                f.write(chunk)
-                                        
-                                        if os.path.getsize(output_path) > 10000:  # Check file is not empty
-                                            logger.info(f"Successfully downloaded TikTok video directly: {output_path}")
-                                            video_path = output_path
-                                            break
-                            except Exception as e:
-                                logger.warning(f"Error downloading from found URL: {e}")
-                
-                except Exception as e:
-                    logger.error(f"Error in direct TikTok download: {e}")
+        # For less obvious TikTok cases, check for a slideshow while the video downloads
+        if is_tiktok:
+            slideshow_result = await _try_tiktok_slideshow(url)
+            if slideshow_result:
+                # Prefer the slideshow; yt-dlp may have fetched just a single frame of it.
+                # The token stops the download at its next progress update and deletes
+                # whatever it produces; the slot stays taken until yt-dlp has let go
+                video_cancel.cancel()
+                if not video_future.cancel():
+                    slot.release_after(video_future)
+                logger.info("Stopping the video download of %s in favour of its slideshow", url)
+                return slideshow_result
+        
+        try:
+            video_path = await asyncio.wrap_future(video_future)
+        except yt_dlp.utils.DownloadError as e:
+            if not is_tiktok:
+                raise
+            logger.warning("yt-dlp TikTok download failed: %s", e)
+            if not skip_primary:
+                _record_tiktok_host_failure(TIKTOK_API_HOSTNAME, e)
+            video_path = None
+        
+        # If TikTok download failed, race the fallback methods
+        if not video_path and is_tiktok:
+            logger.info("Initial TikTok download failed, trying fallback methods...")
             
-            # Last resort - try with a completely different method using a different API
-            if not video_path or not os.path.exists(video_path):
-                logger.info("Third fallback: Trying TikTok download with SaveFrom API...")
-                try:
-                    savefrom_url = f"https://en.savefrom.net/download-from-tiktok/#url={url}"
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Referer': 'https://www.google.com/'
-                    }
-                    
-                    response = requests.get(savefrom_url, headers=headers)
-                    if response.status_code == 200:
-                        video_pattern = r'(https://[^"\']+\.mp4[^"\']*)'
-                        matches = re.findall(video_pattern, response.text)
-                        
-                        for match in matches:
-                            try:
-                                timestamp = int(time.time())
-                                output_path = os.path.join(DOWNLOAD_DIR, f"tiktok_savefrom_{timestamp}.mp4")
-                                
-                                with requests.get(match, stream=True, headers=headers, timeout=60) as dl_response:
-                                    if dl_response.status_code == 200:
-                                        with open(output_path, 'wb') as f:
-                                            for chunk in dl_response.iter_content(chunk_size=8192):
-                                                f.write(chunk)
-                                                
-                                        if os.path.getsize(output_path) > 10000:
-                                            logger.info(f"Successfully downloaded TikTok video with SaveFrom: {output_path}")
-                                            video_path = output_path
-                                            break
-                            except Exception as e:
-                                logger.warning(f"Error with SaveFrom API download: {e}")
-                                continue
-                except Exception as e:
-                    logger.error(f"Error in SaveFrom TikTok download: {e}")
+            # Direct methods that bypass yt-dlp, plus a yt-dlp retry with a different API
+            # unless that is what the initial attempt already used
+            attempts = [
+                ("direct page download", lambda cancel: _download_tiktok_from_page(url, cancel)),
+                ("SaveFrom API", lambda cancel: _download_tiktok_savefrom(url, cancel)),
+            ]
+            if not skip_primary:
+                fallback_options = {**options, 'extractor_args': TIKTOK_FALLBACK_EXTRACTOR_ARGS}
+                attempts.insert(0, ("musicaldown API", lambda cancel: loop.run_in_executor(YTDLP_EXECUTOR, download, fallback_options, cancel)))
+            video_path = await _first_successful_download(attempts)
                     
+        # Single sanity check on whichever path won
         if not video_path or not os.path.exists(video_path):
-            logger.error(f"Download failed for {url}")
+            logger.error("Download failed for %s", url)
             return None
         
-        logger.info(f"Successfully downloaded video to {video_path}")
+        logger.info("Successfully downloaded video to %s", video_path)
         return video_path
     
     except Exception as e:
-        logger.error(f"Error downloading video: {str(e)}")
+        logger.error("Error downloading video: %s", e)
         return None
@@ -4,28 +4,206 @@ Handles downloading images from Pinterest pins.
 """
 import os
 import re
+import asyncio
+import json
+import shutil
+import types
 import logging
+import threading
+import collections
 import tempfile
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib.parse import urlparse
+from utils import unique_name, HTTP_SESSION
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Create a downloads directory if it doesn't exist
+# Prefer the C-backed lxml parser, falling back to the stdlib parser if it is unavailable
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# selectolax's C parser is used for pin pages when installed
+try:
+    from selectolax.lexbor import LexborHTMLParser as FastHTMLParser
+except ImportError:
+    FastHTMLParser = None
+
+class _PinPageStrainer(SoupStrainer):
+    """Keeps only the tags _scan_pin_page reads; the children of a kept tag come along."""
+    
+    TAGS = frozenset({'meta', 'img', 'video', 'script'})
+    
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # A plain SoupStrainer can only AND name and attribute rules, but the
+        # pin-closeup-image container can be any tag
+        return name in self.TAGS or bool(attrs) and attrs.get('data-test-id') == 'pin-closeup-image'
+
+# Limits the BeautifulSoup fallback to those tags so the rest of the page is never built
+PIN_PAGE_STRAINER = _PinPageStrainer()
+
+# Prefer orjson for parsing the page's JSON scripts, falling back to the stdlib json module
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Page, image and video requests go through the process-wide session to reuse its connections
+_SESSION = HTTP_SESSION
+
+# Block size for copying streamed downloads to disk
+STREAM_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Pixel dimensions embedded in image URLs, e.g. 236x350
+_IMAGE_SIZE_RE = re.compile(r'(\d+)x(\d+)')
+
+# File extensions by Content-Type subtype (image/<subtype>, video/<subtype>)
+_IMAGE_EXTENSIONS = {
+    'jpeg': 'jpg', 'jpg': 'jpg', 'pjpeg': 'jpg', 'png': 'png', 'gif': 'gif',
+    'webp': 'webp', 'avif': 'avif', 'heic': 'heic',
+}
+_VIDEO_EXTENSIONS = {'mp4': 'mp4', 'webm': 'webm', 'quicktime': 'mov'}
+
+def _content_subtype(content_type):
+    """Return the lowercased subtype of a Content-Type header, e.g. 'jpeg' for 'image/jpeg; q=1'."""
+    return content_type.split(';', 1)[0].rpartition('/')[2].strip().lower()
+
+# Path fragments that mark a Pinterest video pin
+_VIDEO_PATH_INDICATORS = ('/video/', 'watch/', 'player/', 'reel/')
+
+# Browser-like request headers, built once and shared read-only by every download
+_PIN_PAGE_HEADERS = types.MappingProxyType({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.pinterest.com/'
+})
+_PIN_VIDEO_HEADERS = types.MappingProxyType({
+    **_PIN_PAGE_HEADERS,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+})
+
+# Create the downloads directory once at import; the download functions write into it without re-checking
 DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), "pinterest_images")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-async def download_pinterest_image(url):
+def _scan_pin_page(html_text):
+    """
+    Pull the tags the Pinterest extractors look at out of a pin page.
+    
+    Uses selectolax when it is installed and BeautifulSoup otherwise, and returns
+    plain Python data so the extractors do not depend on either parser's API.
+    
+    Args:
+        html_text (str): Pin page HTML
+        
+    Returns:
+        dict: 'meta' ({property: content}, first tag wins), 'images' (img attribute
+            dicts), 'closeup_images' (src of the first img in each pin-closeup-image
+            element), 'video_sources' (src of each video tag, then its source tags)
+            and 'scripts' ({type: [script bodies]})
+    """
+    if FastHTMLParser is not None:
+        tree = FastHTMLParser(html_text)
+        metas = (node.attributes for node in tree.css('meta[property]'))
+        images = [node.attributes for node in tree.css('img')]
+        closeups = (element.css_first('img') for element in tree.css('[data-test-id="pin-closeup-image"]'))
+        closeup_srcs = [img.attributes.get('src') for img in closeups if img is not None]
+        video_srcs = [
+            src
+            for video in tree.css('video')
+            for src in [video.attributes.get('src')] + [source.attributes.get('src') for source in video.css('source')]
+        ]
+        scripts = ((node.attributes.get('type'), node.text()) for node in tree.css('script[type]'))
+    else:
+        soup = BeautifulSoup(html_text, HTML_PARSER, parse_only=PIN_PAGE_STRAINER)
+        metas = (tag.attrs for tag in soup.find_all('meta', property=True))
+        images = [img.attrs for img in soup.find_all('img')]
+        closeups = (element.find('img') for element in soup.find_all(attrs={'data-test-id': 'pin-closeup-image'}))
+        closeup_srcs = [img.get('src') for img in closeups if img is not None]
+        video_srcs = [
+            src
+            for video in soup.find_all('video')
+            for src in [video.get('src')] + [source.get('src') for source in video.find_all('source')]
+        ]
+        # get_text() returns a plain str; orjson rejects bs4's NavigableString subclass
+        scripts = ((script.get('type'), script.get_text()) for script in soup.find_all('script', type=True))
+    
+    meta = {}
+    for attrs in metas:
+        if attrs.get('content'):
+            meta.setdefault(attrs['property'], attrs['content'])
+    
+    script_texts = {}
+    for script_type, text in scripts:
+        if text:
+            script_texts.setdefault(script_type, []).append(text)
+    
+    return {
+        'meta': meta,
+        'images': images,
+        'closeup_images': [src for src in closeup_srcs if src],
+        'video_sources': [src for src in video_srcs if src],
+        'scripts': script_texts,
+    }
+
+# Recently resolved pin.it / redirected pin links -> final pin page URL, least recently used first
+PIN_REDIRECT_CACHE_SIZE = 1024
+_pin_redirects = collections.OrderedDict()
+_pin_redirects_lock = threading.Lock()
+
+async def _fetch_pin_page(url, headers):
+    """
+    Fetch a pin page, going straight to the resolved URL for links seen before.
+    
+    GET follows redirects itself, so shortened pin.it links are resolved on the
+    way; the final URL is remembered so repeated shares skip the redirect hops.
+    
+    Args:
+        url (str): Pin URL, possibly a pin.it short link
+        headers (Mapping): Request headers
+        
+    Returns:
+        requests.Response: The page response
+    """
+    with _pin_redirects_lock:
+        target = _pin_redirects.get(url)
+        if target:
+            _pin_redirects.move_to_end(url)
+    
+    response = await asyncio.to_thread(_SESSION.get, target or url, headers=headers)
+    with _pin_redirects_lock:
+        if target and response.status_code != 200:
+            # The pin may have moved; resolve it afresh next time
+            _pin_redirects.pop(url, None)
+        elif not target and response.status_code == 200 and response.history:
+            logger.info(f"Resolved to: {response.url}")
+            _pin_redirects[url] = response.url
+            if len(_pin_redirects) > PIN_REDIRECT_CACHE_SIZE:
+                _pin_redirects.popitem(last=False)
+    return response
+
+def _save_stream(response, file_path):
+    """
+    Copy a streamed response body to a file. Blocking; run it with asyncio.to_thread.
+    
+    Args:
+        response (requests.Response): Response opened with stream=True
+        file_path (str): Destination path
+    """
+    with response, open(file_path, 'wb') as f:
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, f, length=STREAM_CHUNK_SIZE)
+
+async def download_pinterest_image(url, page=None):
     """
     Download image from Pinterest.
     
     Args:
         url (str): URL of the Pinterest pin
+        page (dict, optional): The pin page as returned by classify_pin; fetched if omitted
         
     Returns:
         str: Path to the downloaded image file or None if download fails
@@ -34,51 +212,32 @@ async def download_pinterest_image(url):
     
     try:
         # Set up headers to simulate a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.pinterest.com/'
-        }
-        
-        # Normalize Pinterest URL if needed
-        if 'pin.it' in url:
-            logger.info("Converting shortened Pinterest URL to full URL")
-            try:
-                response = requests.head(url, headers=headers, allow_redirects=True)
-                if response.status_code == 200:
-                    url = response.url
-                    logger.info(f"Resolved to: {url}")
-            except Exception as e:
-                logger.warning(f"Error following Pinterest redirect: {e}")
-        
-        # Fetch the Pinterest page
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch Pinterest page: {response.status_code}")
-            return None
+        headers = _PIN_PAGE_HEADERS
         
-        # Parse the HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
+        if page is None:
+            # Fetch the Pinterest page
+            response = await _fetch_pin_page(url, headers)
+            
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch Pinterest page: {response.status_code}")
+                return None
+            
+            # Parse the HTML
+            page = _scan_pin_page(response.text)
         
         # Look for the image URL - Pinterest stores high-res images in meta tags
         image_url = None
         
         # Method 1: Look for og:image meta tag (most reliable)
-        try:
-            og_image = soup.find('meta', property='og:image')
-            if og_image and hasattr(og_image, 'attrs') and 'content' in og_image.attrs:
-                image_url = og_image.attrs['content']
-                logger.info(f"Found image URL in og:image meta tag: {image_url}")
-        except (AttributeError, TypeError):
-            logger.warning("Error accessing og:image meta tag properties")
+        if page['meta'].get('og:image'):
+            image_url = page['meta']['og:image']
+            logger.info(f"Found image URL in og:image meta tag: {image_url}")
         
         # Method 2: Look for high-res image tags
         if not image_url:
-            images = soup.find_all('img')
             # Filter for Pinterest images and sort by size if available
             pinterest_images = []
-            for img in images:
+            for img in page['images']:
                 src = img.get('src')
                 if src and ('pinimg.com' in src or 'pinterest.com' in src):
                     # Check for dimensions in the URL or attributes
@@ -91,7 +250,7 @@ async def download_pinterest_image(url):
                             pinterest_images.append((src, 0))
                     else:
                         # Try to find dimensions in the URL
-                        size_match = re.search(r'(\d+)x(\d+)', src)
+                        size_match = _IMAGE_SIZE_RE.search(src)
                         if size_match:
                             width = int(size_match.group(1))
                             pinterest_images.append((src, width))
@@ -105,14 +264,9 @@ async def download_pinterest_image(url):
                 logger.info(f"Found image in sorted list: {image_url}")
         
         # Method 3: Look for data-test-id attributes (Pinterest's UI elements)
-        if not image_url:
-            image_elements = soup.find_all(attrs={"data-test-id": "pin-closeup-image"})
-            for element in image_elements:
-                img = element.find('img')
-                if img and img.get('src'):
-                    image_url = img.get('src')
-                    logger.info(f"Found image with data-test-id: {image_url}")
-                    break
+        if not image_url and page['closeup_images']:
+            image_url = page['closeup_images'][0]
+            logger.info(f"Found image with data-test-id: {image_url}")
         
         # If we couldn't find an image URL, return None
         if not image_url:
@@ -124,34 +278,22 @@ async def download_pinterest_image(url):
             logger.error("Invalid image URL type")
             return None
             
-        image_response = requests.get(image_url, headers=headers)
+        image_response = await asyncio.to_thread(_SESSION.get, image_url, headers=headers, stream=True)
         if image_response.status_code != 200:
             logger.error(f"Failed to download image: {image_response.status_code}")
+            image_response.close()
             return None
         
-        # Determine the file extension
-        content_type = image_response.headers.get('content-type', '').lower()
-        if 'jpeg' in content_type or 'jpg' in content_type:
-            ext = 'jpg'
-        elif 'png' in content_type:
-            ext = 'png'
-        elif 'gif' in content_type:
-            ext = 'gif'
-        elif 'webp' in content_type:
-            ext = 'webp'
-        else:
-            # Default to jpg if we can't determine the type
-            ext = 'jpg'
-        
-        # Generate a filename
-        import time
-        timestamp = int(time.time())
-        filename = f"pinterest_image_{timestamp}.{ext}"
+        # Determine the file extension, defaulting to jpg if we can't determine the type
+        content_type = image_response.headers.get('content-type', '')
+        ext = _IMAGE_EXTENSIONS.get(_content_subtype(content_type), 'jpg')
+        
+        # Generate a unique filename so concurrent downloads never collide
+        filename = f"{unique_name('pinterest_image')}.{ext}"
         file_path = os.path.join(DOWNLOAD_DIR, filename)
         
-        # Save the image
-        with open(file_path, 'wb') as f:
-            f.write(image_response.content)
+        # Save the image, streaming the body straight to disk off the event loop
+        await asyncio.to_thread(_save_stream, image_response, file_path)
         
         logger.info(f"Successfully downloaded Pinterest image to {file_path}")
         return file_path
@@ -160,12 +302,13 @@ async def download_pinterest_image(url):
         logger.error(f"Error downloading Pinterest image: {str(e)}")
         return None
 
-async def download_pinterest_video(url):
+async def download_pinterest_video(url, page=None):
     """
     Download video from Pinterest.
     
     Args:
         url (str): URL of the Pinterest pin with video
+        page (dict, optional): The pin page as returned by classify_pin; fetched if omitted
         
     Returns:
         str: Path to the downloaded video file or None if download fails
@@ -174,119 +317,50 @@ async def download_pinterest_video(url):
     
     try:
         # Set up headers to simulate a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Referer': 'https://www.pinterest.com/'
-        }
-        
-        # Normalize Pinterest URL if needed
-        if 'pin.it' in url:
-            logger.info("Converting shortened Pinterest URL to full URL")
-            try:
-                response = requests.head(url, headers=headers, allow_redirects=True)
-                if response.status_code == 200:
-                    url = response.url
-                    logger.info(f"Resolved to: {url}")
-            except Exception as e:
-                logger.warning(f"Error following Pinterest redirect: {e}")
-        
-        # Fetch the Pinterest page
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch Pinterest page: {response.status_code}")
-            return None
+        headers = _PIN_VIDEO_HEADERS
         
-        # Parse the HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
+        if page is None:
+            # Fetch the Pinterest page
+            response = await _fetch_pin_page(url, headers)
+            
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch Pinterest page: {response.status_code}")
+                return None
+            
+            # Parse the HTML
+            page = _scan_pin_page(response.text)
+            # pin.it links only show the pin id once redirected
+            page['url'] = response.url
         
         # Look for the video URL - Pinterest stores video URLs in multiple places
         video_url = None
         
         # Method 1: Look for og:video meta tag
-        try:
-            og_video = soup.find('meta', property='og:video')
-            if og_video and hasattr(og_video, 'attrs') and 'content' in og_video.attrs:
-                video_url = og_video.attrs['content']
-                logger.info(f"Found video URL in og:video meta tag: {video_url}")
-        except (AttributeError, TypeError):
-            logger.warning("Error accessing og:video meta tag properties")
+        if page['meta'].get('og:video'):
+            video_url = page['meta']['og:video']
+            logger.info(f"Found video URL in og:video meta tag: {video_url}")
             
         # Method 2: Look for og:video:url meta tag
-        if not video_url:
-            try:
-                og_video_url = soup.find('meta', property='og:video:url')
-                if og_video_url and hasattr(og_video_url, 'attrs') and 'content' in og_video_url.attrs:
-                    video_url = og_video_url.attrs['content']
-                    logger.info(f"Found video URL in og:video:url meta tag: {video_url}")
-            except (AttributeError, TypeError):
-                logger.warning("Error accessing og:video:url meta tag properties")
-        
-        # Method 3: Look for video tags
-        if not video_url:
-            video_tags = soup.find_all('video')
-            for video_tag in video_tags:
-                src = video_tag.get('src')
-                if src:
-                    video_url = src
-                    logger.info(f"Found video source in video tag: {video_url}")
-                    break
-                
-                # Check for source tags inside video
-                source_tags = video_tag.find_all('source')
-                for source in source_tags:
-                    src = source.get('src')
-                    if src:
-                        video_url = src
-                        logger.info(f"Found video source in source tag: {video_url}")
-                        break
+        if not video_url and page['meta'].get('og:video:url'):
+            video_url = page['meta']['og:video:url']
+            logger.info(f"Found video URL in og:video:url meta tag: {video_url}")
+        
+        # Method 3: Look for video tags and the source tags inside them
+        if not video_url and page['video_sources']:
+            video_url = page['video_sources'][0]
+            logger.info(f"Found video source in video tag: {video_url}")
         
         # Method 4: Look for data in JSON-LD scripts
         if not video_url:
-            scripts = soup.find_all('script', attrs={'type': 'application/ld+json'})
-            for script in scripts:
-                if script.string:
-                    try:
-                        import json
-                        data = json.loads(script.string)
-                        if isinstance(data, dict) and 'video' in data and 'contentUrl' in data['video']:
-                            video_url = data['video']['contentUrl']
-                            logger.info(f"Found video URL in JSON-LD: {video_url}")
-                            break
-                    except (json.JSONDecodeError, KeyError, TypeError):
-                        continue
-        
-        # Method 5: Look for video URL in Redux state
+            video_url = _json_ld_video_url(page)
+            if video_url:
+                logger.info(f"Found video URL in JSON-LD: {video_url}")
+        
+        # Method 5: Look for this pin's video URL in Redux state
         if not video_url:
-            scripts = soup.find_all('script', attrs={'type': 'application/json'})
-            for script in scripts:
-                if script.string and '"videos"' in script.string:
-                    try:
-                        import json
-                        data = json.loads(script.string)
-                        if 'props' in data and 'initialReduxState' in data['props']:
-                            pins = data['props']['initialReduxState'].get('pins', {})
-                            if pins:
-                                pin_id = list(pins.keys())[0]
-                                pin_data = pins[pin_id]
-                                if 'videos' in pin_data and pin_data['videos'].get('video_list'):
-                                    videos = pin_data['videos']['video_list']
-                                    # Find the highest quality video
-                                    best_video = None
-                                    best_quality = 0
-                                    for video_id, video_info in videos.items():
-                                        quality = int(video_info.get('width', 0))
-                                        if quality > best_quality and 'url' in video_info:
-                                            best_quality = quality
-                                            best_video = video_info['url']
-                                    
-                                    if best_video:
-                                        video_url = best_video
-                                        logger.info(f"Found video URL in Redux state: {video_url}")
-                    except Exception as e:
-                        logger.warning(f"Error parsing JSON data for video: {e}")
+            video_url = _redux_video_url(page, url)
+            if video_url:
+                logger.info(f"Found video URL in Redux state: {video_url}")
         
         # If we couldn't find a video URL, return None
         if not video_url:
@@ -303,39 +377,32 @@ async def download_pinterest_video(url):
             logger.error("Invalid video URL type")
             return None
             
-        video_response = requests.get(video_url, headers=headers, stream=True)
+        video_response = await asyncio.to_thread(_SESSION.get, video_url, headers=headers, stream=True)
         if video_response.status_code != 200:
             logger.error(f"Failed to download video: {video_response.status_code}")
+            video_response.close()
             return None
         
         # Check if the content type is a video type
         content_type = video_response.headers.get('content-type', '').lower()
         if not ('video' in content_type or 'octet-stream' in content_type):
             logger.error(f"Content is not a video: {content_type}")
+            video_response.close()
             return None
         
         # Determine the file extension from content type or URL
-        if 'mp4' in video_url.lower():
-            ext = 'mp4'
-        elif 'webm' in video_url.lower():
-            ext = 'webm'
-        elif 'mov' in video_url.lower():
-            ext = 'mov'
-        else:
-            # Default to mp4 if we can't determine the type
-            ext = 'mp4'
-        
-        # Generate a filename
-        import time
-        timestamp = int(time.time())
-        filename = f"pinterest_video_{timestamp}.{ext}"
+        ext = _VIDEO_EXTENSIONS.get(_content_subtype(content_type))
+        if not ext:
+            # e.g. application/octet-stream: go by the URL, defaulting to mp4
+            url_lower = video_url.lower()
+            ext = next((candidate for candidate in ('mp4', 'webm', 'mov') if candidate in url_lower), 'mp4')
+        
+        # Generate a unique filename so concurrent downloads never collide
+        filename = f"{unique_name('pinterest_video')}.{ext}"
         file_path = os.path.join(DOWNLOAD_DIR, filename)
         
-        # Save the video
-        with open(file_path, 'wb') as f:
-            for chunk in video_response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        # Save the video, copying the raw stream in large blocks off the event loop
+        await asyncio.to_thread(_save_stream, video_response, file_path)
         
         logger.info(f"Successfully downloaded Pinterest video to {file_path}")
         return file_path
@@ -344,6 +411,146 @@ async def download_pinterest_video(url):
         logger.error(f"Error downloading Pinterest video: {str(e)}")
         return None
 
+# Pin id in a pin page URL, e.g. 123456789 in /pin/123456789/
+_PIN_ID_RE = re.compile(r'/pin/([^/?#]+)')
+
+def _json_ld_video_url(page):
+    """
+    Find the pin's video URL in the page's JSON-LD scripts.
+    
+    Only a video object's contentUrl counts; image pins carry a contentUrl too.
+    
+    Args:
+        page (dict): Pin page as returned by _scan_pin_page
+        
+    Returns:
+        str: Video URL, or None if there is none
+    """
+    for script_text in page['scripts'].get('application/ld+json', ()):
+        # Only scripts that mention contentUrl can hold the video, so skip parsing the rest
+        if '"contentUrl"' not in script_text:
+            continue
+        try:
+            data = _json_loads(script_text)
+            if isinstance(data, dict) and 'video' in data and 'contentUrl' in data['video']:
+                return data['video']['contentUrl']
+        except (ValueError, KeyError, TypeError):
+            continue
+    return None
+
+def _redux_video_url(page, url):
+    """
+    Find the pin's highest quality video URL in the page's Redux state.
+    
+    The state also holds related pins, so only the pin the URL points at is used;
+    without a pin id in the URL the state must hold that one pin alone.
+    
+    Args:
+        page (dict): Pin page as returned by _scan_pin_page
+        url (str): URL of the pin
+        
+    Returns:
+        str: Video URL, or None if there is none
+    """
+    id_match = _PIN_ID_RE.search(urlparse(page.get('url') or url).path)
+    for script_text in page['scripts'].get('application/json', ()):
+        if '"video_list"' not in script_text:
+            continue
+        try:
+            data = _json_loads(script_text)
+            if 'props' in data and 'initialReduxState' in data['props']:
+                pins = data['props']['initialReduxState'].get('pins', {})
+                if id_match:
+                    pin_data = pins.get(id_match.group(1))
+                else:
+                    pin_data = next(iter(pins.values())) if len(pins) == 1 else None
+                if pin_data and 'videos' in pin_data and pin_data['videos'].get('video_list'):
+                    videos = pin_data['videos']['video_list']
+                    # Find the highest quality video
+                    best_video = None
+                    best_quality = 0
+                    for video_id, video_info in videos.items():
+                        quality = int(video_info.get('width', 0))
+                        if quality > best_quality and 'url' in video_info:
+                            best_quality = quality
+                            best_video = video_info['url']
+                    if best_video:
+                        return best_video
+        except Exception as e:
+            logger.warning(f"Error parsing JSON data for video: {e}")
+    return None
+
+def _pin_has_video(page, url):
+    """
+    Check whether a scanned pin page carries a video of the pin itself.
+    
+    Args:
+        page (dict): Pin page as returned by _scan_pin_page
+        url (str): URL of the pin
+        
+    Returns:
+        bool: True if any of the places download_pinterest_video looks in has a video
+    """
+    return bool(
+        page['meta'].get('og:video')
+        or page['meta'].get('og:video:url')
+        or page['video_sources']
+        or _json_ld_video_url(page)
+        or _redux_video_url(page, url)
+    )
+
+async def classify_pin(url):
+    """
+    Fetch a pin page once and tell whether the pin is a video or an image.
+    
+    The scanned page is returned too, so it can be passed to download_pinterest_image
+    or download_pinterest_video instead of fetching and parsing the page again.
+    
+    Args:
+        url (str): URL of the Pinterest pin
+        
+    Returns:
+        tuple: ('video' or 'image', page), or (None, None) if the page could not be fetched
+    """
+    try:
+        response = await _fetch_pin_page(url, _PIN_VIDEO_HEADERS)
+        if response.status_code != 200:
+            logger.error(f"Failed to fetch Pinterest page: {response.status_code}")
+            return None, None
+        page = _scan_pin_page(response.text)
+        # pin.it links only show the pin id once redirected
+        page['url'] = response.url
+    except Exception as e:
+        logger.error(f"Error fetching Pinterest page: {str(e)}")
+        return None, None
+    
+    return ('video' if _pin_has_video(page, url) else 'image'), page
+
+async def download_pinterest_media(url):
+    """
+    Download a pin as a video if its page carries one, otherwise as an image.
+    
+    URL heuristics cannot tell most /pin/<id>/ videos from images, so the page is
+    fetched and parsed once and the same scan is shared by both extractors.
+    
+    Args:
+        url (str): URL of the Pinterest pin
+        
+    Returns:
+        str: Path to the downloaded file or None if download fails
+    """
+    pin_type, page = await classify_pin(url)
+    if page is None:
+        return None
+    
+    if pin_type == 'video':
+        video_path = await download_pinterest_video(url, page)
+        if video_path:
+            return video_path
+        logger.info("No downloadable video found on the pin, falling back to its image")
+    
+    return await download_pinterest_image(url, page)
+
 def is_pinterest_video_url(url):
     """
     Check if a URL is likely to be a Pinterest video rather than an image.
@@ -364,9 +571,4 @@ def is_pinterest_video_url(url):
     path = parsed_url.path.lower()
     
     # Pinterest video pins often have these indicators in the URL
-    video_indicators = ['/video/', 'watch/', 'player/', 'reel/']
-    for indicator in video_indicators:
-        if indicator in path:
-            return True
-    
-    return False
\ No newline at end of file
+    return any(indicator in path for indicator in _VIDEO_PATH_INDICATORS)
\ No newline at end of file
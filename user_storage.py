@@ -4,20 +4,48 @@ User storage module for managing user-specific media files.
 import os
 import json
 import shutil
+import time
+import atexit
 import logging
+import threading
 from pathlib import Path
-from utils import sanitize_filename
+from utils import sanitize_filename, unique_name
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # Define storage directory
 STORAGE_BASE_DIR = os.path.join(os.path.expanduser("~"), ".social_media_bot")
 STORAGE_DATA_FILE = os.path.join(STORAGE_BASE_DIR, "user_data.json")
 
+# Prefer orjson for the user data file, falling back to the stdlib json module
+try:
+    import orjson
+    _json_loads = orjson.loads
+    def _json_dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(data):
+        return json.dumps(data, indent=2).encode()
+
+# Parsed user data and the data file's mtime when it was read or written, so the
+# file is only parsed again when something else changes it. Bot handlers run in
+# several threads: hold the lock from reading the data until it has been saved.
+_USER_DATA_LOCK = threading.RLock()
+_user_data_cache = {'data': None, 'mtime': None, 'dirty': False}
+# Per-user {lowercased name: saved name} indexes over the cached data, built on first use
+_lower_names = {}
+
+# Changes are written back SAVE_DELAY seconds after the first unsaved one, so a
+# burst of saves and deletes costs a single write of the data file
+SAVE_DELAY = 0.5
+_flush_timer = None
+
+# User directories already created and secured by this process
+_created_user_dirs = set()
+# str.translate table deleting path separators from user IDs
+_PATH_SEPARATORS_REMOVAL = str.maketrans('', '', '/\\')
+
 def initialize_user_storage():
     """Initialize the storage directories and data file."""
     # Create base storage directory if it doesn't exist
@@ -43,20 +71,169 @@ def initialize_user_storage():
         logger.info("Initialized user storage data file")
 
 def _get_user_data():
-    """Get the user data from the JSON file."""
-    try:
-        with open(STORAGE_DATA_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        logger.warning("User data file not found or corrupted, creating new one")
-        with open(STORAGE_DATA_FILE, 'w') as f:
-            json.dump({}, f)
-        return {}
+    """Get the user data, re-reading the JSON file only if it changed since the last read."""
+    with _USER_DATA_LOCK:
+        # Unsaved changes are newer than anything on disk
+        if _user_data_cache['dirty']:
+            return _user_data_cache['data']
+        try:
+            mtime = os.stat(STORAGE_DATA_FILE).st_mtime_ns
+            if _user_data_cache['data'] is not None and _user_data_cache['mtime'] == mtime:
+                return _user_data_cache['data']
+            with open(STORAGE_DATA_FILE, 'rb') as f:
+                data = _json_loads(f.read())
+            _lower_names.clear()
+        except FileNotFoundError:
+            logger.warning("User data file not found, creating new one")
+            data = {}
+            _lower_names.clear()
+            _save_user_data(data)
+            return data
+        except json.JSONDecodeError as e:
+            # Keep the unreadable file aside for manual recovery and carry on with
+            # an empty store, so one bad write does not take the bot down
+            corrupt_path = f"{STORAGE_DATA_FILE}.{int(time.time())}.corrupt"
+            os.replace(STORAGE_DATA_FILE, corrupt_path)
+            logger.error(f"User data file {STORAGE_DATA_FILE} is corrupted ({e}); moved it to {corrupt_path} and started with empty data")
+            data = {}
+            _lower_names.clear()
+            _save_user_data(data)
+            return data
+        _user_data_cache['data'] = data
+        _user_data_cache['mtime'] = mtime
+        return data
 
 def _save_user_data(data):
-    """Save the user data to the JSON file."""
-    with open(STORAGE_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    """
+    Save the user data to the JSON file and keep it as the cached copy.
+    
+    The data is written to a temporary file that then replaces the old one, so a
+    crash mid-write can never leave a truncated data file behind.
+    """
+    tmp_path = STORAGE_DATA_FILE + '.tmp'
+    with _USER_DATA_LOCK:
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_json_dumps(data))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, STORAGE_DATA_FILE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _user_data_cache['data'] = data
+        _user_data_cache['mtime'] = os.stat(STORAGE_DATA_FILE).st_mtime_ns
+        _user_data_cache['dirty'] = False
+
+def _mark_dirty():
+    """Record that the cached user data changed and schedule a write if none is pending."""
+    global _flush_timer
+    with _USER_DATA_LOCK:
+        _user_data_cache['dirty'] = True
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(SAVE_DELAY, flush_user_data)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+@atexit.register
+def flush_user_data():
+    """Write any pending user data changes to disk now."""
+    global _flush_timer
+    with _USER_DATA_LOCK:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if not _user_data_cache['dirty']:
+            return
+        try:
+            _save_user_data(_user_data_cache['data'])
+        except Exception as e:
+            # The changes stay cached and dirty; the next change or exit retries the write
+            logger.error(f"Error writing user data: {str(e)}")
+
+def _find_media_name(user_id, user_media, name):
+    """
+    Find a user's saved media name by exact or case-insensitive match.
+    
+    Args:
+        user_id (str): Telegram user ID as stored in the data file
+        user_media (dict): The user's saved media
+        name (str): Name to look up
+        
+    Returns:
+        str: The saved name, or None if nothing matches
+    """
+    if name in user_media:
+        return name
+    index = _lower_names.get(user_id)
+    if index is None:
+        # Built in reverse so the first saved name wins among case variants
+        index = _lower_names[user_id] = {saved.lower(): saved for saved in reversed(user_media)}
+    return index.get(name.lower())
+
+def _copy_file(source_path, dest_path):
+    """
+    Copy a file with its metadata, letting the kernel move the bytes where possible.
+    
+    os.copy_file_range copies without passing the data through Python and can share
+    extents on filesystems such as btrfs and XFS. Where it is unavailable or refuses
+    (e.g. across filesystems on newer kernels), shutil.copy2 is used instead.
+    
+    Args:
+        source_path (str): File to copy
+        dest_path (str): Destination path
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if not copied:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                shutil.copystat(source_path, dest_path)
+                return
+        except OSError:
+            pass
+    shutil.copy2(source_path, dest_path)
+
+def _link_or_copy(source_path, dest_path, mode):
+    """
+    Place a copy of source_path at dest_path, replacing any existing file.
+    
+    Downloads are never modified once written, so a hard link (no bytes copied)
+    is used when both paths are on the same filesystem; otherwise the file is copied.
+    A hard link shares the source's inode, so mode is only applied to copies;
+    changing it on a link would change the original download too.
+    
+    Args:
+        source_path (str): File to save
+        dest_path (str): Destination path
+        mode (int): Permission bits for a copied file
+    """
+    # Link or copy under a temporary name first, so an existing save of the same
+    # name is swapped out in one step
+    tmp_path = os.path.join(os.path.dirname(dest_path), unique_name('.saving'))
+    try:
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            # Different filesystem (EXDEV) or no hard link support
+            _copy_file(source_path, tmp_path)
+            try:
+                os.chmod(tmp_path, mode)
+            except Exception as e:
+                logger.warning(f"Could not set file permissions: {str(e)}")
+        os.replace(tmp_path, dest_path)
+    finally:
+        # Left behind on failure, or when dest_path already links to the same file
+        # (rename() is then a no-op)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def _get_user_dir(user_id):
     """
@@ -64,8 +241,10 @@ def _get_user_dir(user_id):
     Each user has their own private directory based on their Telegram ID.
     """
     # Ensure user_id is converted to string and sanitized to prevent directory traversal
-    safe_user_id = str(user_id).replace('..', '').replace('/', '').replace('\\', '')
+    safe_user_id = str(user_id).translate(_PATH_SEPARATORS_REMOVAL).replace('..', '')
     user_dir = os.path.join(STORAGE_BASE_DIR, safe_user_id)
+    if user_dir in _created_user_dirs:
+        return user_dir
     os.makedirs(user_dir, exist_ok=True)
     
     # Set directory permissions to be accessible only by the owner (700)
@@ -73,7 +252,8 @@ def _get_user_dir(user_id):
         os.chmod(user_dir, 0o700)  # Read, write, execute only for owner
     except Exception as e:
         logger.warning(f"Could not set directory permissions: {str(e)}")
-        
+    
+    _created_user_dirs.add(user_dir)
     return user_dir
 
 def save_media(user_id, name, source_path, media_type):
@@ -90,6 +270,8 @@ def save_media(user_id, name, source_path, media_type):
         bool: True if save was successful, False otherwise
     """
     try:
+        uid = str(user_id)
+        
         # Ensure the name is valid and safe
         safe_name = sanitize_filename(name)
         
@@ -107,30 +289,23 @@ def save_media(user_id, name, source_path, media_type):
         # Create destination path
         dest_path = os.path.join(user_dir, filename)
         
-        # Copy the file
-        shutil.copy2(source_path, dest_path)
-        
-        # Set file permissions to be accessible only by owner
-        try:
-            os.chmod(dest_path, 0o600)  # Read and write only for owner
-        except Exception as e:
-            logger.warning(f"Could not set file permissions: {str(e)}")
-        
-        # Update user data
-        user_data = _get_user_data()
-        
-        # Initialize user data if not exists
-        if str(user_id) not in user_data:
-            user_data[str(user_id)] = {}
-        
-        # Save file information
-        user_data[str(user_id)][safe_name] = {
-            "path": filename,
-            "type": media_type
-        }
+        # Copy the file; a copy is made readable only by the owner, while a hard
+        # link keeps the download's mode and is guarded by the user's 700 directory
+        _link_or_copy(source_path, dest_path, 0o600)
         
-        # Save user data
-        _save_user_data(user_data)
+        with _USER_DATA_LOCK:
+            # Update user data
+            user_data = _get_user_data()
+            
+            # Save file information
+            user_data.setdefault(uid, {})[safe_name] = {
+                "path": filename,
+                "type": media_type
+            }
+            _lower_names.get(uid, {}).setdefault(safe_name.lower(), safe_name)
+            
+            # Save user data
+            _mark_dirty()
         
         logger.info(f"Saved {media_type} as '{safe_name}' for user {user_id}")
         return True
@@ -151,33 +326,25 @@ def retrieve_media(user_id, name):
         tuple: (file_path, media_type) if found, None otherwise
     """
     try:
-        # Get user data
-        user_data = _get_user_data()
+        uid = str(user_id)
         
-        # Check if user exists
-        if str(user_id) not in user_data:
-            logger.warning(f"No data found for user {user_id}")
-            return None
-        
-        # Check if the media name exists
-        user_media = user_data[str(user_id)]
-        
-        # Try to find the media by exact name or case-insensitive match
-        media_info = None
-        name_lower = name.lower()
-        
-        if name in user_media:
-            media_info = user_media[name]
-        else:
-            # Try case-insensitive search
-            for saved_name, info in user_media.items():
-                if saved_name.lower() == name_lower:
-                    media_info = info
-                    break
-        
-        if not media_info:
-            logger.warning(f"Media '{name}' not found for user {user_id}")
-            return None
+        with _USER_DATA_LOCK:
+            # Get user data
+            user_data = _get_user_data()
+            
+            # Check if user exists
+            user_media = user_data.get(uid)
+            if user_media is None:
+                logger.warning(f"No data found for user {user_id}")
+                return None
+            
+            # Try to find the media by exact name or case-insensitive match
+            found_name = _find_media_name(uid, user_media, name)
+            media_info = user_media[found_name] if found_name else None
+            
+            if not media_info:
+                logger.warning(f"Media '{name}' not found for user {user_id}")
+                return None
         
         # Get file path
         user_dir = _get_user_dir(user_id)
@@ -205,18 +372,19 @@ def get_user_media_list(user_id):
         list: List of tuples (name, type) of saved media
     """
     try:
-        # Get user data
-        user_data = _get_user_data()
-        
-        # Check if user exists
-        if str(user_id) not in user_data:
-            return []
+        uid = str(user_id)
         
-        # Get user media
-        user_media = user_data[str(user_id)]
-        
-        # Return list of (name, type) tuples
-        return [(name, info["type"]) for name, info in user_media.items()]
+        with _USER_DATA_LOCK:
+            # Get user data
+            user_data = _get_user_data()
+            
+            # Check if user exists
+            user_media = user_data.get(uid)
+            if user_media is None:
+                return []
+            
+            # Return list of (name, type) tuples
+            return [(name, info["type"]) for name, info in user_media.items()]
     
     except Exception as e:
         logger.error(f"Error getting user media list: {str(e)}")
@@ -234,49 +402,42 @@ def delete_media(user_id, name):
         bool: True if deletion was successful, False otherwise
     """
     try:
-        # Get user data
-        user_data = _get_user_data()
-        
-        # Check if user exists
-        if str(user_id) not in user_data:
-            logger.warning(f"No data found for user {user_id}")
-            return False
-        
-        # Check if the media name exists
-        user_media = user_data[str(user_id)]
-        found_name = None
+        uid = str(user_id)
         
-        # Try to find the media by exact name or case-insensitive match
-        name_lower = name.lower()
-        
-        if name in user_media:
-            found_name = name
-        else:
-            # Try case-insensitive search
-            for saved_name in user_media.keys():
-                if saved_name.lower() == name_lower:
-                    found_name = saved_name
-                    break
-        
-        if not found_name:
-            logger.warning(f"Media '{name}' not found for user {user_id}")
-            return False
-        
-        # Get file path
-        media_info = user_media[found_name]
-        user_dir = _get_user_dir(user_id)
-        file_path = os.path.join(user_dir, media_info["path"])
-        
-        # Delete the file if it exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Deleted file: {file_path}")
-        else:
-            logger.warning(f"File not found: {file_path}")
-        
-        # Remove the entry from user data
-        del user_data[str(user_id)][found_name]
-        _save_user_data(user_data)
+        with _USER_DATA_LOCK:
+            # Get user data
+            user_data = _get_user_data()
+            
+            # Check if user exists
+            user_media = user_data.get(uid)
+            if user_media is None:
+                logger.warning(f"No data found for user {user_id}")
+                return False
+            
+            # Try to find the media by exact name or case-insensitive match
+            found_name = _find_media_name(uid, user_media, name)
+            
+            if not found_name:
+                logger.warning(f"Media '{name}' not found for user {user_id}")
+                return False
+            
+            # Get file path
+            media_info = user_media[found_name]
+            user_dir = _get_user_dir(user_id)
+            file_path = os.path.join(user_dir, media_info["path"])
+            
+            # Delete the file if it exists
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f"Deleted file: {file_path}")
+            else:
+                logger.warning(f"File not found: {file_path}")
+            
+            # Remove the entry from user data
+            del user_media[found_name]
+            # Another case variant may now be the first match, so rebuild on next lookup
+            _lower_names.pop(uid, None)
+            _mark_dirty()
         
         logger.info(f"Deleted media '{found_name}' for user {user_id}")
         return True
@@ -6,23 +6,30 @@ import os
 import json
 import logging
 import time
+import collections
 from utils import sanitize_filename
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # In-memory storage for Vercel (serverless environment)
 # Note: Data will be lost when function instance is recycled
-USER_DATA = {}
-TEMP_STORAGE = {}  # { user_id: { name: (content, media_type, timestamp) } }
+# Users are kept least recently used first; beyond MAX_STORED_USERS the oldest are
+# dropped so a long-lived warm instance cannot grow without bound
+MAX_STORED_USERS = 10000
+USER_DATA = collections.OrderedDict()  # { user_id: { name: MediaEntry } }
+# A saved media reference; a tuple is far smaller than a dict per entry
+MediaEntry = collections.namedtuple('MediaEntry', 'name type added')
+# Per-user {lowercased name: saved name} indexes over USER_DATA, built on first use
+_lower_names = {}
 
-# Define a temp directory that works in Vercel
+# Define a temp directory that works in Vercel; it always exists there, and
+# _get_user_dir creates any missing parents anyway
 TEMP_DIR = "/tmp"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR, exist_ok=True)
+
+# User directories already created by this instance
+_created_user_dirs = set()
+# str.translate table deleting path separators from user IDs
+_PATH_SEPARATORS_REMOVAL = str.maketrans('', '', '/\\')
 
 def initialize_user_storage():
     """Initialize the storage for Vercel."""
@@ -30,14 +37,28 @@ def initialize_user_storage():
     # Nothing to initialize in the serverless version - we're using in-memory storage
 
 def _get_user_data():
-    """Get the user data from in-memory storage."""
-    global USER_DATA
-    return USER_DATA.copy()
+    """Get the user data from in-memory storage; changes to it are stored directly."""
+    return USER_DATA
 
-def _save_user_data(data):
-    """Save the user data to in-memory storage."""
-    global USER_DATA
-    USER_DATA = data.copy()
+def _find_media_name(user_id, user_media, name):
+    """
+    Find a user's saved media name by exact or case-insensitive match.
+    
+    Args:
+        user_id (str): Telegram user ID as stored in USER_DATA
+        user_media (dict): The user's saved media
+        name (str): Name to look up
+        
+    Returns:
+        str: The saved name, or None if nothing matches
+    """
+    if name in user_media:
+        return name
+    index = _lower_names.get(user_id)
+    if index is None:
+        # Built in reverse so the first saved name wins among case variants
+        index = _lower_names[user_id] = {saved.lower(): saved for saved in reversed(user_media)}
+    return index.get(name.lower())
 
 def _get_user_dir(user_id):
     """
@@ -46,9 +67,11 @@ def _get_user_dir(user_id):
     For Vercel, we use the /tmp directory which is writable.
     """
     # Ensure user_id is converted to string and sanitized
-    safe_user_id = str(user_id).replace('..', '').replace('/', '').replace('\\', '')
+    safe_user_id = str(user_id).translate(_PATH_SEPARATORS_REMOVAL).replace('..', '')
     user_dir = os.path.join(TEMP_DIR, f"telegram_bot_{safe_user_id}")
-    os.makedirs(user_dir, exist_ok=True)
+    if user_dir not in _created_user_dirs:
+        os.makedirs(user_dir, exist_ok=True)
+        _created_user_dirs.add(user_dir)
     return user_dir
 
 def save_media(user_id, name, source_path, media_type):
@@ -65,6 +88,8 @@ def save_media(user_id, name, source_path, media_type):
         bool: True if save was successful, False otherwise
     """
     try:
+        uid = str(user_id)
+        
         # Ensure the name is valid and safe
         safe_name = sanitize_filename(name)
         
@@ -80,19 +105,14 @@ def save_media(user_id, name, source_path, media_type):
         # Instead, we'll keep track of the relationship in memory
         user_data = _get_user_data()
         
-        # Initialize user data if not exists
-        if str(user_id) not in user_data:
-            user_data[str(user_id)] = {}
-        
         # Save file information - we only track names for webhook responses
-        user_data[str(user_id)][safe_name] = {
-            "name": safe_name,
-            "type": media_type,
-            "added": int(time.time())
-        }
-        
-        # Save user data
-        _save_user_data(user_data)
+        user_data.setdefault(uid, {})[safe_name] = MediaEntry(safe_name, media_type, int(time.time()))
+        _lower_names.get(uid, {}).setdefault(safe_name.lower(), safe_name)
+        user_data.move_to_end(uid)
+        while len(user_data) > MAX_STORED_USERS:
+            evicted_uid, _ = user_data.popitem(last=False)
+            _lower_names.pop(evicted_uid, None)
+            logger.info(f"Evicted saved media references for user {evicted_uid}")
         
         logger.info(f"Saved reference to {media_type} as '{safe_name}' for user {user_id}")
         return True
@@ -115,31 +135,22 @@ def retrieve_media(user_id, name):
         tuple: (None, media_type) if reference found, None otherwise
     """
     try:
+        uid = str(user_id)
+        
         # Get user data
         user_data = _get_user_data()
         
         # Check if user exists
-        if str(user_id) not in user_data:
+        user_media = user_data.get(uid)
+        if user_media is None:
             logger.warning(f"No data found for user {user_id}")
             return None
-        
-        # Check if the media name exists
-        user_media = user_data[str(user_id)]
+        user_data.move_to_end(uid)
         
         # Try to find the media by exact name or case-insensitive match
-        media_info = None
-        name_lower = name.lower()
-        
-        if name in user_media:
-            media_info = user_media[name]
-        else:
-            # Try case-insensitive search
-            for saved_name, info in user_media.items():
-                if saved_name.lower() == name_lower:
-                    media_info = info
-                    break
-        
-        if not media_info:
+        found_name = _find_media_name(uid, user_media, name)
+        
+        if not found_name:
             logger.warning(f"Media '{name}' not found for user {user_id}")
             return None
         
@@ -148,7 +159,7 @@ def retrieve_media(user_id, name):
         logger.info(f"Found reference to media '{name}' for user {user_id}")
         
         # Instead, tell the user that persistent storage is not supported
-        return (None, media_info["type"])
+        return (None, user_media[found_name].type)
     
     except Exception as e:
         logger.error(f"Error retrieving media: {str(e)}")
@@ -165,18 +176,18 @@ def get_user_media_list(user_id):
         list: List of tuples (name, type) of saved media
     """
     try:
+        uid = str(user_id)
+        
         # Get user data
         user_data = _get_user_data()
         
         # Check if user exists
-        if str(user_id) not in user_data:
+        user_media = user_data.get(uid)
+        if user_media is None:
             return []
         
-        # Get user media
-        user_media = user_data[str(user_id)]
-        
         # Return list of (name, type) tuples
-        return [(name, info["type"]) for name, info in user_media.items()]
+        return [(name, entry.type) for name, entry in user_media.items()]
     
     except Exception as e:
         logger.error(f"Error getting user media list: {str(e)}")
@@ -194,37 +205,28 @@ def delete_media(user_id, name):
         bool: True if deletion was successful, False otherwise
     """
     try:
+        uid = str(user_id)
+        
         # Get user data
         user_data = _get_user_data()
         
         # Check if user exists
-        if str(user_id) not in user_data:
+        user_media = user_data.get(uid)
+        if user_media is None:
             logger.warning(f"No data found for user {user_id}")
             return False
         
-        # Check if the media name exists
-        user_media = user_data[str(user_id)]
-        found_name = None
-        
         # Try to find the media by exact name or case-insensitive match
-        name_lower = name.lower()
-        
-        if name in user_media:
-            found_name = name
-        else:
-            # Try case-insensitive search
-            for saved_name in user_media.keys():
-                if saved_name.lower() == name_lower:
-                    found_name = saved_name
-                    break
+        found_name = _find_media_name(uid, user_media, name)
         
         if not found_name:
             logger.warning(f"Media '{name}' not found for user {user_id}")
             return False
         
         # Remove the entry from user data
-        del user_data[str(user_id)][found_name]
-        _save_user_data(user_data)
+        del user_media[found_name]
+        # Another case variant may now be the match; rebuilt on next lookup
+        _lower_names.pop(uid, None)
         
         logger.info(f"Deleted media reference '{found_name}' for user {user_id}")
         return True
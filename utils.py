@@ -6,13 +6,172 @@ import os
 import tempfile
 import logging
 import urllib.parse
+import itertools
+import secrets
+import threading
+import json
+import time
+import atexit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Set up logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Compiled once at import; is_valid_url runs on every incoming message
+_URL_RE = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
+# str.translate table replacing characters that are invalid in file names
+_INVALID_FILENAME_CHARS = str.maketrans(dict.fromkeys('<>:"/\\|?*', '_'))
+
+# Supported domains and their platforms; a host is supported if it is one of
+# them or a subdomain of one
+_PLATFORM_BY_DOMAIN = {
+    'tiktok.com': 'tiktok',
+    'instagram.com': 'instagram',
+    'youtube.com': 'youtube',
+    'youtu.be': 'youtube',
+    'pinterest.com': 'pinterest',
+    'pin.it': 'pinterest',
+}
+_SUPPORTED_SUBDOMAIN_SUFFIXES = tuple('.' + domain for domain in _PLATFORM_BY_DOMAIN)
+
+# Seconds to wait for a short link (vm.tiktok.com etc.) to resolve
+SHORT_LINK_TIMEOUT = 5
+# Persistent cache of resolved short links, shared by every caller of
+# resolve_short_url. Maps short URL -> [resolved URL, expiry timestamp]
+SHORT_LINK_CACHE_FILE = os.path.join(tempfile.gettempdir(), "social_media_downloads", "redirects.json")
+SHORT_LINK_CACHE_TTL = 86400  # 24 hours
+SHORT_LINK_CACHE_NEGATIVE_TTL = 300  # dead links are remembered for 5 minutes
+SHORT_LINK_CACHE_SIZE = 1024
+
+def create_http_session(pool_maxsize=50, retries=3, timeout=30):
+    """
+    Create a requests session with connection pooling, retries and a default timeout.
+    
+    Reusing one session keeps connections alive between requests, so follow-up
+    calls to the same host skip the TCP and TLS handshakes.
+    
+    Args:
+        pool_maxsize (int): Maximum number of pooled connections per host
+        retries (int): Number of retries for failed connections
+        timeout (int): Timeout in seconds for requests that do not pass their own
+        
+    Returns:
+        requests.Session: Configured session
+    """
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    })
+    adapter = HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=pool_maxsize,
+        # Also retry rate-limit and gateway errors, honouring Retry-After; after the last
+        # attempt the error response is returned as usual instead of raising
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 502, 503, 504),
+            raise_on_status=False,
+        ),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    
+    # Session.get/post/head all go through request(), so this covers every call
+    send_request = session.request
+    def request_with_timeout(method, url, **kwargs):
+        kwargs.setdefault('timeout', timeout)
+        return send_request(method, url, **kwargs)
+    session.request = request_with_timeout
+    return session
+
+def load_json_cache(path):
+    """Load a persisted {key: [value, expiry timestamp]} cache from disk."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError, OSError):
+        return {}
+
+def save_json_cache(path, cache, lock, max_entries):
+    """
+    Write a {key: [value, expiry timestamp]} cache to disk.
+    
+    Expired entries are dropped first, then the entries closest to expiry
+    until at most max_entries remain.
+    
+    Args:
+        path (str): File to write the cache to
+        cache (dict): The cache, modified in place
+        lock (threading.Lock): Lock guarding the cache
+        max_entries (int): Maximum number of entries to keep
+    """
+    now = time.time()
+    with lock:
+        for key in [k for k, (_, expires) in cache.items() if expires <= now]:
+            del cache[key]
+        # Keep the cache bounded by dropping the entries closest to expiry
+        overflow = len(cache) - max_entries
+        if overflow > 0:
+            for key in sorted(cache, key=lambda k: cache[k][1])[:overflow]:
+                del cache[key]
+        snapshot = dict(cache)
+    try:
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not persist cache {path}: {e}")
+
+# The process-wide HTTP session; every module sends its requests through it so
+# connections to a host are pooled once instead of once per module
+HTTP_SESSION = create_http_session()
+atexit.register(HTTP_SESSION.close)
+
+_short_links = load_json_cache(SHORT_LINK_CACHE_FILE)
+_short_links_lock = threading.Lock()
+
+def resolve_short_url(url):
+    """
+    Resolve a shortened URL to its redirect target, using the persistent cache.
+    
+    Blocking; async callers run it in a worker thread.
+    
+    Args:
+        url (str): Shortened URL to resolve
+        
+    Returns:
+        str: Resolved URL, or the original URL if resolution fails
+    """
+    with _short_links_lock:
+        cached = _short_links.get(url)
+    if cached and cached[1] > time.time():
+        logger.info("Resolved %s to (cached): %s", url, cached[0])
+        return cached[0]
+    
+    try:
+        # The shared session already sends a browser User-Agent
+        response = HTTP_SESSION.head(url, allow_redirects=True, timeout=SHORT_LINK_TIMEOUT)
+    except Exception as e:
+        logger.warning("Error following redirect for %s: %s", url, e)
+        return url
+    
+    if response.status_code == 200:
+        resolved, ttl = response.url, SHORT_LINK_CACHE_TTL
+        logger.info("Resolved %s to: %s", url, resolved)
+    elif response.status_code in (404, 410):
+        # Remember dead links briefly so retries don't hit the host again
+        resolved, ttl = url, SHORT_LINK_CACHE_NEGATIVE_TTL
+        logger.info("Short URL %s is gone (%s)", url, response.status_code)
+    else:
+        return url
+    with _short_links_lock:
+        _short_links[url] = [resolved, time.time() + ttl]
+    save_json_cache(SHORT_LINK_CACHE_FILE, _short_links, _short_links_lock, SHORT_LINK_CACHE_SIZE)
+    return resolved
+
 def is_valid_url(text):
     """
     Check if a text contains a valid URL from supported platforms.
@@ -23,35 +182,35 @@ def is_valid_url(text):
     Returns:
         bool: True if text contains a valid URL, False otherwise
     """
-    # Simple URL regex pattern
-    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-    
     # Check if text contains a URL
-    match = re.search(url_pattern, text)
+    match = _URL_RE.search(text)
     if not match:
         return False
     
     url = match.group(0)
     parsed_url = urllib.parse.urlparse(url)
-    domain = parsed_url.netloc.lower()
-    
-    # List of supported domains
-    supported_domains = [
-        'tiktok.com',
-        'vm.tiktok.com',
-        'instagram.com',
-        'youtube.com',
-        'youtu.be',
-        'pinterest.com',
-        'pin.it'
-    ]
-    
-    # Check if the URL is from a supported domain
-    for supported in supported_domains:
-        if supported in domain:
-            return True
-    
-    return False
+    domain = parsed_url.hostname or ''
+    
+    # Check if the URL is from a supported domain or one of its subdomains
+    return domain in _PLATFORM_BY_DOMAIN or domain.endswith(_SUPPORTED_SUBDOMAIN_SUFFIXES)
+
+def _platform_for_domain(domain):
+    """
+    Find the platform a host belongs to by looking up its parent domains.
+    
+    Args:
+        domain (str): Lowercased host name, e.g. 'vm.tiktok.com'
+        
+    Returns:
+        str: Platform name, or None for unsupported hosts
+    """
+    while True:
+        platform = _PLATFORM_BY_DOMAIN.get(domain)
+        if platform:
+            return platform
+        _, dot, domain = domain.partition('.')
+        if not dot:
+            return None
 
 def get_url_type(url):
     """
@@ -64,11 +223,12 @@ def get_url_type(url):
         tuple: (type, platform) where type is 'video' or 'image' and platform is the social media platform
     """
     parsed_url = urllib.parse.urlparse(url)
-    domain = parsed_url.netloc.lower()
+    domain = parsed_url.hostname or ''
     path = parsed_url.path.lower()
+    platform = _platform_for_domain(domain)
     
     # Pinterest
-    if 'pinterest' in domain or 'pin.it' in domain:
+    if platform == 'pinterest':
         from pinterest_extractor import is_pinterest_video_url
         if is_pinterest_video_url(url):
             return ('video', 'pinterest')
@@ -76,20 +236,20 @@ def get_url_type(url):
         return ('image', 'pinterest')
     
     # Instagram
-    elif 'instagram' in domain:
+    elif platform == 'instagram':
         if '/reel/' in path or '/reels/' in path:
             return ('video', 'instagram')
         return ('video', 'instagram')  # Default to video for Instagram (most use case)
     
     # TikTok can be video or slideshow (treated as video)
-    elif 'tiktok' in domain:
+    elif platform == 'tiktok':
         # Check for TikTok photo/slideshow indicators
         if '/photo/' in path:
             logger.info("Detected TikTok slideshow by URL path: /photo/")
             return ('slideshow', 'tiktok')
         
-        # Check query parameters
-        query = urllib.parse.parse_qs(parsed_url.query)
+        # Check query parameters; most links have none, so skip parsing then
+        query = urllib.parse.parse_qs(parsed_url.query) if parsed_url.query else {}
         if 'aweme_type' in query and query['aweme_type'][0] == '150':
             logger.info("Detected TikTok slideshow by aweme_type=150")
             return ('slideshow', 'tiktok')
@@ -109,35 +269,29 @@ def get_url_type(url):
         # TikTok short link resolution - need to check the actual URL after redirection
         if 'vm.tiktok.com' in domain or 'vt.tiktok.com' in domain:
             logger.info("TikTok short URL detected, checking if it's a slideshow...")
-            try:
-                import requests
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                }
-                response = requests.head(url, headers=headers, allow_redirects=True)
-                if response.status_code == 200:
-                    full_url = response.url
-                    parsed_full = urllib.parse.urlparse(full_url)
-                    if '/photo/' in parsed_full.path.lower():
-                        logger.info("Detected TikTok slideshow after short URL resolution")
-                        return ('slideshow', 'tiktok')
-                    
-                    # Check query parameters of the resolved URL
-                    full_query = urllib.parse.parse_qs(parsed_full.query)
-                    if 'aweme_type' in full_query and full_query['aweme_type'][0] == '150':
-                        logger.info("Detected TikTok slideshow after URL resolution")
-                        return ('slideshow', 'tiktok')
-                    
-                    if 'pic_cnt' in full_query and full_query.get('pic_cnt', ['0'])[0] != '0':
-                        logger.info("Detected TikTok slideshow after URL resolution (has pic_cnt)")
-                        return ('slideshow', 'tiktok')
-            except Exception as e:
-                logger.warning(f"Error resolving TikTok short URL: {e}")
+            full_url = resolve_short_url(url)
+            # Without a redirect the checks above already covered this URL
+            if full_url and full_url != url:
+                parsed_full = urllib.parse.urlparse(full_url)
+                if '/photo/' in parsed_full.path.lower():
+                    logger.info("Detected TikTok slideshow after short URL resolution")
+                    return ('slideshow', 'tiktok')
+                
+                # Check query parameters of the resolved URL
+                full_query = urllib.parse.parse_qs(parsed_full.query) if parsed_full.query else {}
+                if 'aweme_type' in full_query and full_query['aweme_type'][0] == '150':
+                    logger.info("Detected TikTok slideshow after URL resolution")
+                    return ('slideshow', 'tiktok')
+                
+                if 'pic_cnt' in full_query and full_query.get('pic_cnt', ['0'])[0] != '0':
+                    logger.info("Detected TikTok slideshow after URL resolution (has pic_cnt)")
+                    return ('slideshow', 'tiktok')
         
         # Also check for 'share_item_id' which can indicate a collection of images
         if 'share_item_id' in query:
             # If this URL has a share_item_id, we need additional checks
-            if 'photo' in url.lower() or 'image' in url.lower() or 'slideshow' in url.lower():
+            lowered_url = url.lower()
+            if 'photo' in lowered_url or 'image' in lowered_url or 'slideshow' in lowered_url:
                 logger.info("Detected TikTok slideshow by keywords in URL")
                 return ('slideshow', 'tiktok')
             
@@ -145,12 +299,21 @@ def get_url_type(url):
         return ('video', 'tiktok')
     
     # YouTube is always video
-    elif 'youtube' in domain or 'youtu.be' in domain:
+    elif platform == 'youtube':
         return ('video', 'youtube')
     
     # Default to video for any other supported platform
     return ('video', 'unknown')
 
+# Media type by lowercased file extension, for get_media_type
+_MEDIA_TYPE_BY_EXTENSION = {
+    **dict.fromkeys(('.mp4', '.avi', '.mov', '.flv', '.wmv', '.mkv', '.webm'), 'video'),
+    **dict.fromkeys(('.mp3', '.wav', '.ogg', '.m4a', '.flac', '.aac'), 'audio'),
+    **dict.fromkeys(('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'), 'image'),
+}
+# Path fragments marking a file without a known extension as an image
+_IMAGE_PATH_HINTS = ('image', 'photo', 'pinterest')
+
 def get_media_type(file_path):
     """
     Determine the media type based on file extension.
@@ -166,22 +329,16 @@ def get_media_type(file_path):
     
     ext = os.path.splitext(file_path)[1].lower()
     
-    video_extensions = ['.mp4', '.avi', '.mov', '.flv', '.wmv', '.mkv', '.webm']
-    audio_extensions = ['.mp3', '.wav', '.ogg', '.m4a', '.flac', '.aac']
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
+    media_type = _MEDIA_TYPE_BY_EXTENSION.get(ext)
+    if media_type:
+        return media_type
     
-    if ext in video_extensions:
-        return 'video'
-    elif ext in audio_extensions:
-        return 'audio'
-    elif ext in image_extensions:
+    # Try to guess based on the file path
+    lowered_path = file_path.lower()
+    if any(hint in lowered_path for hint in _IMAGE_PATH_HINTS):
         return 'image'
-    else:
-        # Try to guess based on the file path
-        if 'image' in file_path.lower() or 'photo' in file_path.lower() or 'pinterest' in file_path.lower():
-            return 'image'
-        # Default to video for truly unknown extensions
-        return 'video'
+    # Default to video for truly unknown extensions
+    return 'video'
 
 def sanitize_filename(filename):
     """
@@ -194,8 +351,7 @@ def sanitize_filename(filename):
         str: Sanitized filename
     """
     # Remove or replace invalid characters
-    invalid_chars = r'[<>:"/\\|?*]'
-    sanitized = re.sub(invalid_chars, '_', filename)
+    sanitized = filename.translate(_INVALID_FILENAME_CHARS)
     
     # Limit length to avoid file system limits
     max_length = 50
@@ -211,6 +367,22 @@ def sanitize_filename(filename):
     
     return sanitized
 
+# Per-process sequence for download file names; combined with a random suffix so
+# names stay unique across concurrent downloads and across bot processes
+_FILE_COUNTER = itertools.count()
+
+def unique_name(prefix):
+    """
+    Build a collision-free file or directory name with the given prefix.
+    
+    Args:
+        prefix (str): Name prefix, e.g. 'video'
+        
+    Returns:
+        str: Name without extension
+    """
+    return f"{prefix}_{next(_FILE_COUNTER)}_{secrets.token_hex(4)}"
+
 def create_temp_dir():
     """
     Create a temporary directory for storing downloads.
@@ -7,20 +7,30 @@ import sys
 import requests
 import argparse
 
+# Seconds to wait for each endpoint before reporting it as unreachable
+REQUEST_TIMEOUT = 30
+
 def check_webhook_endpoint(url):
     """Check if the webhook endpoint is responding."""
+    webhook_url = f"{url.rstrip('/')}/api/set-webhook"
+    
+    session = requests.Session()
     try:
+        # Only the status matters here, so skip the body; some servers reject HEAD
+        response = session.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+        if response.status_code == 405:
+            response = session.get(url, timeout=REQUEST_TIMEOUT)
+        
         # Check the base URL
-        response = requests.get(url)
         if response.status_code == 200:
             print(f"✅ Base URL is responding: {url} (Status: {response.status_code})")
         else:
             print(f"❌ Base URL returned status code {response.status_code}: {url}")
             return False
         
-        # Check webhook setup endpoint
-        webhook_url = f"{url.rstrip('/')}/api/set-webhook"
-        response = requests.get(webhook_url)
+        # Check webhook setup endpoint. This (re)registers the webhook with
+        # Telegram, so it only runs once the deployment itself is known to be up
+        response = session.get(webhook_url, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             print(f"✅ Webhook setup endpoint is working: {webhook_url}")
             print(f"Response: {response.json()}")
@@ -35,6 +45,8 @@ def check_webhook_endpoint(url):
     except requests.RequestException as e:
         print(f"❌ Error connecting to {url}: {str(e)}")
         return False
+    finally:
+        session.close()
 
 def main():
     parser = argparse.ArgumentParser(description="Verify deployment of Telegram bot webhook")